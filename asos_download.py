@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from datetime import date
+from pathlib import Path
+
+import requests
+from tqdm import tqdm
+
+from metrics import stage
+from scheduler import FetchScheduler
+
+# Overridable so benchmarks can point the downloader at a local stub server
+ASOS_URL = os.environ.get('MESONET_ASOS_URL', 'https://mesonet.agron.iastate.edu/cgi-bin/request/asos.py')
+
+
+def month_windows(start: date, end: date) -> list[tuple[date, date]]:
+    """Split [start, end) into calendar-month windows, each [window_start, window_end)."""
+    windows = []
+    current = start
+    while current < end:
+        next_month = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        windows.append((current, min(next_month, end)))
+        current = next_month
+    return windows
+
+
+def plan_chunks(stations: list[str], start: date, end: date, group_size: int = 25) -> list[dict]:
+    # One chunk per (station group x month); the id is stable across reruns with the same stations
+    chunks = []
+    for i in range(0, len(stations), group_size):
+        group = stations[i:i + group_size]
+        group_id = hashlib.sha1(','.join(group).encode()).hexdigest()[:10]
+        for window_start, window_end in month_windows(start, end):
+            chunks.append({
+                'id': f"{window_start:%Y-%m-%d}_{window_end:%Y-%m-%d}_{group_id}",
+                'stations': group,
+                'start': window_start,
+                'end': window_end,
+            })
+    return chunks
+
+
+def load_manifest(path: Path) -> dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'completed': {}}
+
+
+def save_manifest(manifest: dict, path: Path) -> None:
+    # Write then rename so a killed run never leaves a torn manifest
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+def download_chunk(chunk: dict, params: dict, out_dir: Path) -> Path:
+    chunk_params = {
+        **params,
+        'station': chunk['stations'],
+        'year1': chunk['start'].year, 'month1': chunk['start'].month, 'day1': chunk['start'].day, 'hour1': 0,
+        'year2': chunk['end'].year, 'month2': chunk['end'].month, 'day2': chunk['end'].day, 'hour2': 0,
+    }
+    target = out_dir / f"{chunk['id']}.csv"
+    part = out_dir / f"{chunk['id']}.csv.part"
+    with requests.get(ASOS_URL, params=chunk_params, stream=True, timeout=(10, 300)) as response:
+        # Raise so the scheduler can retry 429/5xx responses
+        response.raise_for_status()
+        with open(part, 'wb') as f:
+            for block in response.iter_content(chunk_size=1 << 20):
+                f.write(block)
+    os.replace(part, target)
+    return target
+
+
+@stage('download_asos')
+def download_asos(stations: list[str], start: date, end: date, params: dict, out_dir: Path = Path('asos/chunks'),
+                  group_size: int = 25, max_in_flight: int = 2) -> list[Path]:
+    """
+    Download ASOS observations for [start, end) in (station group x month) chunks.
+
+    Each chunk is streamed to its own CSV under out_dir and recorded in
+    out_dir/manifest.json once complete, so a rerun only fetches the chunks
+    that are missing.
+
+    Args:
+        stations: ASOS station ids.
+        start: First day to download.
+        end: Day after the last day to download.
+        params: Base Mesonet request params (data, tz, format, ...); station and date fields are set per chunk.
+        out_dir: Directory for the chunk files and manifest.
+        group_size: Stations per request.
+        max_in_flight: Concurrent downloads; requests are also rate limited by the 'mesonet' token bucket.
+
+    Returns:
+        Paths of all completed chunk files.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / 'manifest.json'
+    manifest = load_manifest(manifest_path)
+    chunks = plan_chunks(stations, start, end, group_size)
+    todo = [chunk for chunk in chunks if chunk['id'] not in manifest['completed']
+            or not (out_dir / manifest['completed'][chunk['id']]).exists()]
+    print(f"{len(chunks) - len(todo)} of {len(chunks)} chunks already downloaded")
+    scheduler = FetchScheduler('mesonet', max_in_flight=max_in_flight)
+    results = scheduler.map(lambda chunk: download_chunk(chunk, params, out_dir), todo)
+    for chunk, path, error in tqdm(results, total=len(todo)):
+        if error is not None:
+            print(f"Failed to download chunk {chunk['id']}: {error}")
+            continue
+        manifest['completed'][chunk['id']] = path.name
+        save_manifest(manifest, manifest_path)
+    return [out_dir / manifest['completed'][chunk['id']] for chunk in chunks if chunk['id'] in manifest['completed']]
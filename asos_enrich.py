@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from asos_ingest import read_observations, SKY_COLUMNS
+from station_index import StationIndex
+from grid import catch_timestamps
+from metrics import stage
+
+ASOS_COLUMNS = ['tmpf', 'mslp', 'sknt', *SKY_COLUMNS]
+
+
+@stage('get_asos_observations')
+def get_asos_observations(df: pd.DataFrame, stations_path: Path = Path('asos/stations.parquet'),
+                          obs_dir: Path = Path('asos/observations'), k: int = 3, tolerance: str = '2h',
+                          batch_size: int = 25) -> pd.DataFrame:
+    """
+    Attach the ASOS observation closest in time to each catch from its nearest station(s).
+
+    Each catch is matched against its k nearest stations; the nearest one with
+    an observation within `tolerance` of the catch time wins. Matching is a
+    sorted-time merge_asof per station, run over batches of stations so only
+    those stations' observations are in memory at once.
+
+    Args:
+        df: Catch table with lat, lon and date_str.
+        stations_path: Station metadata table written by asos_ingest.
+        obs_dir: Observation dataset written by asos_ingest.
+        k: Candidate stations per catch.
+        tolerance: Largest allowed gap between catch time and observation.
+        batch_size: Stations per merge batch.
+
+    Returns:
+        df with asos_station, asos_distance_km, asos_valid and asos_<column> columns added.
+    """
+    metadata = pd.read_parquet(stations_path)
+    index = StationIndex(dict(zip(metadata['station'], zip(metadata['lat'], metadata['lon']))))
+
+    catches = pd.DataFrame({'row': np.arange(len(df)), 'lat': df['lat'].to_numpy(dtype=float),
+                            'lon': df['lon'].to_numpy(dtype=float),
+                            'timestamp': catch_timestamps(df).reset_index(drop=True)})
+    catches = catches.dropna()
+    # Station lookups only need each distinct location once
+    locations = catches[['lat', 'lon']].drop_duplicates().reset_index(drop=True)
+    station_ids, distances = index.nearest(locations['lat'].to_numpy(), locations['lon'].to_numpy(), k=k)
+    candidates = pd.concat([
+        locations.assign(rank=rank, station=station_ids[:, rank], distance_km=distances[:, rank])
+        for rank in range(station_ids.shape[1])
+    ], ignore_index=True)
+    candidates = catches.merge(candidates, on=['lat', 'lon'])
+
+    matched = []
+    stations = sorted(candidates['station'].unique())
+    for i in range(0, len(stations), batch_size):
+        batch = stations[i:i + batch_size]
+        left = candidates[candidates['station'].isin(batch)].sort_values('timestamp')
+        years = sorted(set((left['timestamp'] - pd.Timedelta(tolerance)).dt.year) |
+                       set((left['timestamp'] + pd.Timedelta(tolerance)).dt.year))
+        obs = read_observations(obs_dir, stations=batch, columns=['station', 'valid', *ASOS_COLUMNS],
+                                filter=ds.field('year').isin(years))
+        if obs.empty:
+            continue
+        obs['station'] = obs['station'].astype(str)
+        obs = obs.dropna(subset=['valid']).sort_values('valid')
+        matched.append(pd.merge_asof(left, obs, left_on='timestamp', right_on='valid', by='station',
+                                     direction='nearest', tolerance=pd.Timedelta(tolerance)))
+
+    asos_columns = ['asos_station', 'asos_distance_km', 'asos_valid', *[f'asos_{col}' for col in ASOS_COLUMNS]]
+    if matched:
+        matched = pd.concat(matched, ignore_index=True).dropna(subset=['valid'])
+        # Nearest station that actually reported wins
+        best = matched.sort_values(['row', 'rank']).drop_duplicates(subset=['row']).set_index('row')
+        best = best.rename(columns={'station': 'asos_station', 'distance_km': 'asos_distance_km', 'valid': 'asos_valid',
+                                    **{col: f'asos_{col}' for col in ASOS_COLUMNS}})[asos_columns]
+    else:
+        best = pd.DataFrame(columns=asos_columns)
+    best = best.reindex(np.arange(len(df)))
+    best.index = df.index
+    return pd.concat([df.drop(columns=asos_columns, errors='ignore'), best], axis=1)
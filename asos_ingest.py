@@ -0,0 +1,113 @@
+import pickle
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from tqdm import tqdm
+
+from metrics import stage
+
+# Value substituted for 'T' (trace) in precipitation/ice columns, in inches
+TRACE_VALUE = 0.0001
+# Requested with tz=America/Chicago, so `valid` is local time
+ASOS_TIMEZONE = 'America/Chicago'
+
+FLOAT_COLUMNS = ['lon', 'lat', 'elevation', 'tmpf', 'dwpf', 'relh', 'drct', 'sknt', 'alti', 'mslp', 'vsby',
+                 'gust', 'skyl1', 'skyl2', 'skyl3', 'skyl4', 'peak_wind_gust', 'peak_wind_drct', 'feel']
+TRACE_COLUMNS = ['p01i', 'ice_accretion_1hr', 'ice_accretion_3hr', 'ice_accretion_6hr', 'snowdepth']
+SKY_COLUMNS = ['skyc1', 'skyc2', 'skyc3', 'skyc4']
+SKY_COVER = pd.CategoricalDtype(['SKC', 'CLR', 'NSC', 'NCD', 'FEW', 'SCT', 'BKN', 'OVC', 'VV'])
+
+
+def read_asos_chunks(path: Path, chunksize: int = 500_000):
+    """
+    Stream an ASOS CSV as typed DataFrame chunks.
+
+    'M' becomes NaN, 'T' becomes TRACE_VALUE, `valid` is parsed to UTC
+    timestamps and station/sky cover columns are categorical.
+    """
+    dtype = {col: 'float32' for col in FLOAT_COLUMNS}
+    # Trace columns mix numbers and 'T', so they are parsed after reading
+    dtype.update({col: 'str' for col in TRACE_COLUMNS + SKY_COLUMNS + ['station', 'valid', 'wxcodes', 'metar']})
+    reader = pd.read_csv(path, dtype=dtype, na_values=['M'], chunksize=chunksize)
+    for chunk in reader:
+        for col in TRACE_COLUMNS:
+            if col in chunk:
+                chunk[col] = pd.to_numeric(chunk[col].replace('T', TRACE_VALUE), errors='coerce').astype('float32')
+        for col in SKY_COLUMNS:
+            if col in chunk:
+                chunk[col] = chunk[col].str.strip().astype(SKY_COVER)
+        chunk['valid'] = (pd.to_datetime(chunk['valid'], format='%Y-%m-%d %H:%M')
+                          .dt.tz_localize(ASOS_TIMEZONE, ambiguous='NaT', nonexistent='shift_forward')
+                          .dt.tz_convert('UTC'))
+        chunk['station'] = chunk['station'].astype('category')
+        yield chunk.dropna(subset=['valid'])
+
+
+@stage('ingest_asos')
+def ingest_asos(files, out_dir: Path = Path('asos/observations'), chunksize: int = 500_000) -> pd.DataFrame:
+    """
+    Ingest ASOS CSVs into a station/year partitioned Parquet dataset.
+
+    Files are processed one chunk at a time, so memory stays bounded by
+    chunksize no matter how many years are ingested. Re-ingesting a file
+    overwrites its own parts instead of duplicating them.
+
+    Args:
+        files: ASOS CSV paths, e.g. the chunk files from asos_download.
+        out_dir: Dataset root; the station metadata table is written next to it as stations.parquet.
+        chunksize: Rows per chunk.
+
+    Returns:
+        Station metadata table (station, lat, lon, elevation).
+    """
+    out_dir = Path(out_dir)
+    stations = {}
+    for path in tqdm(list(files)):
+        path = Path(path)
+        for n, chunk in enumerate(read_asos_chunks(path, chunksize)):
+            meta_columns = [col for col in ['station', 'lat', 'lon', 'elevation'] if col in chunk]
+            for row in chunk[meta_columns].drop_duplicates(subset=['station']).itertuples(index=False):
+                stations.setdefault(row.station, row)
+            chunk = chunk.drop(columns=[col for col in ['lat', 'lon', 'elevation'] if col in chunk])
+            # Partition keys must be plain strings; they come back as categoricals via read_observations
+            chunk['station'] = chunk['station'].astype(str)
+            chunk['year'] = chunk['valid'].dt.year
+            ds.write_dataset(
+                pa.Table.from_pandas(chunk, preserve_index=False), out_dir, format='parquet',
+                partitioning=['station', 'year'], partitioning_flavor='hive',
+                basename_template=f"{path.stem}-{n}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore',
+            )
+    metadata = pd.DataFrame(list(stations.values()))
+    metadata['station'] = metadata['station'].astype(str)
+    metadata = merge_station_metadata(out_dir.parent / 'stations.parquet', metadata)
+    print(f"Ingested {len(metadata)} stations into {out_dir}")
+    return metadata
+
+
+def merge_station_metadata(path: Path, metadata: pd.DataFrame) -> pd.DataFrame:
+    # Keep stations seen in earlier ingests
+    if path.exists():
+        metadata = pd.concat([pd.read_parquet(path), metadata], ignore_index=True)
+    metadata = metadata.drop_duplicates(subset=['station'], keep='last').sort_values('station').reset_index(drop=True)
+    metadata.to_parquet(path, index=False)
+    return metadata
+
+
+def read_observations(out_dir: Path = Path('asos/observations'), stations=None, columns=None, filter=None) -> pd.DataFrame:
+    """Read ingested observations, optionally limited to some stations/columns; station comes back categorical."""
+    partitioning = ds.partitioning(flavor='hive', dictionaries='infer')
+    dataset = ds.dataset(out_dir, format='parquet', partitioning=partitioning)
+    if stations is not None:
+        expr = ds.field('station').isin(list(stations))
+        filter = expr if filter is None else filter & expr
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+
+def write_station_map(metadata: pd.DataFrame, path: Path = Path('station_lat_lon.pkl')) -> None:
+    # Dict of station -> (lat, lon), as used by station_index.StationIndex
+    station_map = dict(zip(metadata['station'], zip(metadata['lat'].astype(float), metadata['lon'].astype(float))))
+    with open(path, 'wb') as fp:
+        pickle.dump(station_map, fp)
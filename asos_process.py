@@ -1,15 +1,9 @@
-import pickle
+from pathlib import Path
 
-import pandas as pd
+from asos_ingest import ingest_asos, write_station_map
 
-# Read the CSV file
-df = pd.read_csv('./asos/mslp_2024-01-01_to_2024-01-01.csv')
-
-# Filter for unique stations and select the first occurrence of lat/lon for each
-unique_stations = df.drop_duplicates(subset=['station'])[['station', 'lat', 'lon']]
+# Stream the downloaded chunk files into the typed observation store
+metadata = ingest_asos(sorted(Path('./asos/chunks').glob('*.csv')))
 
 # Create the dictionary: station -> (lat, lon)
-station_map = {row['station']: (row['lat'], row['lon']) for _, row in unique_stations.iterrows()}
-
-with open("station_lat_lon.pkl", "wb") as fp:
-    pickle.dump(station_map, fp)
+write_station_map(metadata, Path("station_lat_lon.pkl"))
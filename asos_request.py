@@ -1,5 +1,6 @@
-import requests
-import os
+from datetime import date, timedelta
+
+from asos_download import download_asos
 
 
 # https://mesonet.agron.iastate.edu/cgi-bin/request/asos.py?help
@@ -74,20 +75,9 @@ params = {
     'report_type': ['3', '4']
 }
 
-# Create the 'asos' folder if it doesn't exist
-os.makedirs('asos', exist_ok=True)
-
-# Generate file name based on key parameters (data type and date range)
-data_type = params['data']
-start_date = f"{params['year1']}-{params['month1']:02d}-{params['day1']:02d}"
-end_date = f"{params['year2']}-{params['month2']:02d}-{params['day2']:02d}"
-file_name = f"asos/{data_type}_{start_date}_to_{end_date}.csv"
-
-url = 'https://mesonet.agron.iastate.edu/cgi-bin/request/asos.py'
-response = requests.get(url, params=params)
-if response.status_code == 200:
-    with open(file_name, 'wb') as f:
-        f.write(response.content)
-    print(f"Data downloaded successfully to {file_name}.")
-else:
-    print(f"Error: {response.status_code} - {response.text}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Download day1 through day2 inclusive, one (station group x month) chunk at a time
+    start_date = date(params['year1'], params['month1'], params['day1'])
+    end_date = date(params['year2'], params['month2'], params['day2']) + timedelta(days=1)
+    files = download_asos(stations, start_date, end_date, params)
+    print(f"Data downloaded successfully to {len(files)} chunk files.")
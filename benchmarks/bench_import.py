@@ -0,0 +1,75 @@
+"""
+Import-time guard for the pipeline's entry points.
+
+Each module is imported in a fresh interpreter under `python -X importtime`.
+The script reports its cumulative import time (best of --repeat runs) and
+the slowest individual imports. It fails if a module eagerly imports a
+package that should only load on first use, or if it goes over
+--budget-ms.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --modules main distance --repeat 5 --budget-ms 500
+"""
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Packages each module must not import eagerly; network clients and the optional stages load on first use.
+# pyarrow isn't listed: pandas >= 2.2 imports it itself whenever it's installed
+LAZY = {
+    'main': ['openmeteo_requests', 'requests_cache', 'geopy', 'tqdm', 'scipy',
+             'hourly_store', 'asos_enrich', 'asos_ingest', 'features'],
+    'open_meteo': ['openmeteo_requests', 'requests_cache'],
+    'geoloc': ['geopy'],
+    'distance': ['numpy', 'scipy', 'pandas'],
+}
+# "import time:   self [us] |   cumulative | <indent>package"
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def import_profile(module: str) -> list[tuple[int, int, str]]:
+    """Return (self_us, cumulative_us, package) for every package `import module` loads, in -X importtime order."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return [(int(match[1]), int(match[2]), match[4])
+            for match in map(LINE.match, result.stderr.splitlines()) if match]
+
+
+def check(module: str, repeat: int, budget_ms: float = None, top: int = 10) -> list[str]:
+    # Best of `repeat` runs; the first is usually slower while .pyc files and the OS cache warm up
+    profiles = [import_profile(module) for _ in range(repeat)]
+    totals = [next(cumulative for _, cumulative, name in profile if name == module) for profile in profiles]
+    best = min(range(repeat), key=totals.__getitem__)
+    profile = profiles[best]
+    print(f"{module}: {totals[best] / 1000:.1f} ms (best of {repeat})")
+    for self_us, cumulative_us, name in sorted(profile, reverse=True)[:top]:
+        print(f"  {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms cumulative  {name}")
+    failures = []
+    eager = sorted({name.split('.')[0] for _, _, name in profile} & set(LAZY.get(module, [])))
+    if eager:
+        failures.append(f"{module} eagerly imports {', '.join(eager)}")
+    if budget_ms is not None and totals[best] / 1000 > budget_ms:
+        failures.append(f"{module} took {totals[best] / 1000:.1f} ms to import, budget is {budget_ms} ms")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure and guard import time of the pipeline modules")
+    parser.add_argument('--modules', nargs='+', default=list(LAZY))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget-ms', type=float, help="fail if a module's cumulative import time exceeds this")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list per module")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        failures += check(module, args.repeat, args.budget_ms, args.top)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
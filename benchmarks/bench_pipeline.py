@@ -0,0 +1,263 @@
+"""
+End-to-end pipeline benchmark against a local stub server.
+
+For each export size a fresh subprocess gets its own working directory,
+stub server, caches and peak RSS. It runs every stage twice, cold then
+cache-warm, and records per stage: wall time, requests issued and 429s
+per provider, cache hit rate, and peak RSS. With --workers it also times
+enrich on the warm caches for each worker count and records the speedup
+over the smallest count. Results are written as JSON so runs from
+different commits can be compared.
+
+    python benchmarks/bench_pipeline.py --sizes 1000 100000 --latency 0.02 --error-rate 0.01
+    python benchmarks/bench_pipeline.py --sizes 100000 --workers 1 2 4 8
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import metrics  # noqa: E402
+
+ASOS_STATIONS = 20
+ASOS_START = date(2024, 1, 1)
+ASOS_END = date(2024, 3, 1)
+
+
+class PeakRss:
+    """Sample resident set size on a background thread; peak_mb is the max seen while active."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            # No procfs: fall back to the process-lifetime peak (kilobytes on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.current())
+
+    @property
+    def peak_mb(self) -> float:
+        return self.peak / 2 ** 20
+
+
+def failed_providers() -> list[str]:
+    # Providers whose every call in the stage ended in an error; their timings would measure nothing
+    outcomes = {}
+    for (name, labels), value in metrics.registry.counters.items():
+        if name == 'http_requests':
+            labels = dict(labels)
+            outcomes.setdefault(labels['provider'], {})[labels['outcome']] = value
+    return sorted(provider for provider, counts in outcomes.items() if counts.get('error') and not counts.get('ok'))
+
+
+def measure(server, name: str, fn, hit_rate=None) -> tuple[dict, object]:
+    server.reset_counters()
+    metrics.registry.reset()
+    with PeakRss() as rss:
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+    failed = failed_providers()
+    if failed:
+        raise RuntimeError(f"{name}: every {', '.join(failed)} request failed; not recording its timings")
+    numbers = {
+        'wall_s': round(elapsed, 4),
+        'requests': dict(server.requests),
+        'rate_limited': dict(server.errors),
+        'cache_hit_rate': None if hit_rate is None else round(hit_rate, 4),
+        'peak_rss_mb': round(rss.peak_mb, 1),
+    }
+    print(f"  {name:<28} {elapsed:>9.2f} s  requests={sum(server.requests.values()):<6} "
+          f"hit_rate={numbers['cache_hit_rate']}  peak_rss={numbers['peak_rss_mb']} MB")
+    return numbers, result
+
+
+def run_one(rows: int, workdir: Path, latency: float, error_rate: float, recordings: Path,
+            respect_rate_limits: bool, workers=()) -> dict:
+    from stub_server import StubServer
+    from synthetic import generate_export
+
+    server = StubServer(latency=latency, error_rate=error_rate, recordings=recordings).start()
+    # The pipeline modules read their endpoints from the environment at import time
+    os.environ.update(server.environ())
+    os.chdir(workdir)
+
+    import scheduler
+    if not respect_rate_limits:
+        # The stub has no quota; measure pipeline throughput rather than provider politeness.
+        # Open-Meteo requests cost ~100 weighted calls each, so the bucket must hold far more than that
+        for provider in scheduler.PROVIDER_LIMITS:
+            scheduler.PROVIDER_LIMITS[provider] = (1e9, 1e9)
+        scheduler.PROVIDER_QUOTAS.clear()
+    from asos_download import download_asos
+    from asos_enrich import get_asos_observations
+    from asos_ingest import ingest_asos
+    from asos_request import params as asos_params, stations as asos_stations
+    from cache_store import CacheStore
+    from grid import add_grid_cells
+    from main import enrich, get_lat_long, get_lunker_data, get_openmeteo_weather_data, worker_pool
+
+    export = generate_export(workdir / 'export.csv', rows)
+    cache_path = workdir / 'lunker_cache.sqlite'
+    hourly_dir = workdir / 'hourly'
+    asos_dir = workdir / 'asos'
+    passes = {}
+    for pass_name in ['cold', 'warm']:
+        print(f"{rows} rows, {pass_name} pass")
+        stages = {}
+        stages['get_lunker_data'], df = measure(server, 'get_lunker_data', lambda: get_lunker_data(export))
+
+        store = CacheStore(cache_path)
+        names = df['lake_name'].drop_duplicates().tolist()
+        geocode_hits = len(store.get_geocodes(names)) / len(names) if names else 0.0
+        stages['get_lat_long'], df = measure(server, 'get_lat_long', lambda: get_lat_long(cache_path, df), geocode_hits)
+
+        keys = add_grid_cells(df)[['cell_lat', 'cell_lon', 'date_str']].dropna().drop_duplicates()
+        keys = list(keys.itertuples(index=False, name=None))
+        weather_hits = 1 - len(store.missing_weather(keys)) / len(keys) if keys else 0.0
+
+        chunk_dir = asos_dir / 'chunks'
+        stages['asos_download'], files = measure(
+            server, 'asos_download',
+            lambda: download_asos(asos_stations[:ASOS_STATIONS], ASOS_START, ASOS_END, asos_params, chunk_dir))
+        stages['asos_ingest'], _ = measure(
+            server, 'asos_ingest', lambda: ingest_asos(files, asos_dir / 'observations'))
+        stages['asos_enrich'], with_asos = measure(
+            server, 'asos_enrich',
+            lambda: get_asos_observations(df, asos_dir / 'stations.parquet', asos_dir / 'observations'))
+        stages['asos_enrich']['matched_rate'] = round(float(with_asos['asos_valid'].notna().mean()), 4)
+
+        stages['get_openmeteo_weather_data'], df = measure(
+            server, 'get_openmeteo_weather_data',
+            lambda: get_openmeteo_weather_data(cache_path, df, hourly_dir=hourly_dir), weather_hits)
+        for stage in stages.values():
+            stage['rows_per_s'] = round(rows / stage['wall_s'], 1) if stage['wall_s'] else None
+        passes[pass_name] = stages
+
+    # Worker scaling on the warm caches, so it measures the enrichment work rather than the network
+    scaling = {}
+    raw = get_lunker_data(export)
+    for n in workers:
+        print(f"{rows} rows, enrich on {n} worker(s)")
+        with worker_pool(n) as pool:
+            scaling[n], _ = measure(server, f'enrich workers={n}',
+                                    lambda: enrich(raw, cache_path, hourly_dir, asos_dir, n, pool=pool))
+        scaling[n]['rows_per_s'] = round(rows / scaling[n]['wall_s'], 1) if scaling[n]['wall_s'] else None
+    if scaling:
+        base = scaling[min(scaling)]['wall_s']
+        for n, stage in scaling.items():
+            stage['speedup'] = round(base / stage['wall_s'], 2) if stage['wall_s'] else None
+    server.stop()
+    return {'rows': rows, 'passes': passes, 'scaling': scaling}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(old_path: Path, new_path: Path) -> None:
+    old, new = json.loads(old_path.read_text()), json.loads(new_path.read_text())
+    print(f"{old['commit']} -> {new['commit']}")
+    old_runs = {run['rows']: run for run in old['runs']}
+    for run in new['runs']:
+        if run['rows'] not in old_runs:
+            continue
+        for pass_name, stages in run['passes'].items():
+            for stage, numbers in stages.items():
+                before = old_runs[run['rows']]['passes'].get(pass_name, {}).get(stage)
+                if not before:
+                    continue
+                ratio = numbers['wall_s'] / before['wall_s'] if before['wall_s'] else float('nan')
+                print(f"{run['rows']:>9} {pass_name:<5} {stage:<28} {before['wall_s']:>9.2f} s -> "
+                      f"{numbers['wall_s']:>9.2f} s  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL against a local stub server")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000])
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every stub response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of stub responses that are 429s")
+    parser.add_argument('--recordings', type=Path, help="directory of recorded responses to replay")
+    parser.add_argument('--respect-rate-limits', action='store_true',
+                        help="keep the production token-bucket limits instead of unthrottling for the stub")
+    parser.add_argument('--workers', type=int, nargs='+', default=[],
+                        help="also time enrich on warm caches with each of these worker counts, e.g. 1 2 4")
+    parser.add_argument('--out', type=Path, default=ROOT / 'benchmarks' / 'results')
+    parser.add_argument('--compare', type=Path, nargs=2, metavar=('OLD', 'NEW'))
+    # Internal: run a single size in this process and write its result here
+    parser.add_argument('--run-one', type=Path, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.run_one:
+        result = run_one(args.sizes[0], args.workdir, args.latency, args.error_rate, args.recordings,
+                         args.respect_rate_limits, args.workers)
+        args.run_one.write_text(json.dumps(result))
+    else:
+        runs = []
+        for rows in args.sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                result_path = Path(tmp) / 'result.json'
+                command = [sys.executable, __file__, '--run-one', str(result_path), '--workdir', tmp,
+                           '--sizes', str(rows), '--latency', str(args.latency), '--error-rate', str(args.error_rate)]
+                if args.recordings:
+                    command += ['--recordings', str(args.recordings.resolve())]
+                if args.respect_rate_limits:
+                    command.append('--respect-rate-limits')
+                if args.workers:
+                    command += ['--workers', *map(str, args.workers)]
+                subprocess.run(command, check=True)
+                runs.append(json.loads(result_path.read_text()))
+        commit = git_commit()
+        report = {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'config': {'latency': args.latency, 'error_rate': args.error_rate,
+                       'respect_rate_limits': args.respect_rate_limits, 'python': sys.version.split()[0]},
+            'runs': runs,
+        }
+        args.out.mkdir(parents=True, exist_ok=True)
+        out_path = args.out / f"pipeline-{commit}-{time.strftime('%Y%m%dT%H%M%S')}.json"
+        out_path.write_text(json.dumps(report, indent=1))
+        print(f"Results written to {out_path}")
@@ -0,0 +1,70 @@
+"""
+Rows/sec for joining cached weather onto the catch table.
+
+Compares the old per-row iterrows/df.at loop against the keyed merge in
+main.join_weather on a synthetic export. No network access is needed.
+
+    python benchmarks/bench_weather_join.py --rows 100000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache_store import WEATHER_COLUMNS  # noqa: E402
+from main import join_weather  # noqa: E402
+
+
+def synthetic_catches(rows: int, lakes: int = 300, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    lake_lat = rng.uniform(26, 36, lakes)
+    lake_lon = rng.uniform(-106, -94, lakes)
+    lake = rng.integers(0, lakes, rows)
+    dates = pd.to_datetime('1990-01-01') + pd.to_timedelta(rng.integers(0, 35 * 365, rows), unit='D')
+    df = pd.DataFrame({
+        'lake_name': [f'Lake {i}' for i in lake],
+        'lat': lake_lat[lake],
+        'lon': lake_lon[lake],
+        'date_str': dates.strftime('%Y-%m-%d'),
+    })
+    weather = df[['lat', 'lon', 'date_str']].drop_duplicates().reset_index(drop=True)
+    for col in WEATHER_COLUMNS:
+        weather[col] = rng.normal(size=len(weather)).astype('float32')
+    weather = weather.astype({'date_str': 'category'})
+    return df, weather
+
+
+def legacy_join(df: pd.DataFrame, weather: pd.DataFrame) -> pd.DataFrame:
+    # The per-row loop main.get_openmeteo_weather_data used before the keyed join
+    weather_dict = {(row['lat'], row['lon'], row['date_str']): {col: row[col] for col in WEATHER_COLUMNS}
+                    for _, row in weather.iterrows()}
+    for col in WEATHER_COLUMNS:
+        df[col] = None
+    for idx, row in df.iterrows():
+        if pd.notna(row['lat']) and pd.notna(row['lon']) and pd.notna(row['date_str']):
+            key = (row['lat'], row['lon'], row['date_str'])
+            if key in weather_dict:
+                for col in WEATHER_COLUMNS:
+                    df.at[idx, col] = weather_dict[key][col]
+    return df.drop(columns=['date_str'], errors='ignore')
+
+
+def timed(fn, df, weather) -> float:
+    start = time.perf_counter()
+    fn(df.copy(), weather)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    df, weather = synthetic_catches(args.rows)
+    for name, fn in [('iterrows', legacy_join), ('merge', join_weather)]:
+        elapsed = timed(fn, df, weather)
+        print(f"{name:>8}: {args.rows / elapsed:>12,.0f} rows/sec ({elapsed:.2f} s for {args.rows:,} rows)")
@@ -0,0 +1,78 @@
+"""
+FlatBuffers builder functions for the parts of the Open-Meteo schema the stub server writes.
+
+Published openmeteo_sdk releases only ship the generated readers, so these
+are the functions `flatc --python` generates for the same tables in
+openmeteo_sdk/fbs/weather_api.fbs, trimmed to the fields the pipeline reads.
+The slot numbers must match the schema's field order: slot n is the field the
+readers look up at vtable offset 4 + 2n.
+"""
+
+# Field counts of each table, so the vtables have room for every field in the schema
+VARIABLE_WITH_VALUES_FIELDS = 12
+VARIABLES_WITH_TIME_FIELDS = 4
+WEATHER_API_RESPONSE_FIELDS = 14
+
+
+def VariableWithValuesStart(builder):
+    builder.StartObject(VARIABLE_WITH_VALUES_FIELDS)
+
+
+def VariableWithValuesAddValues(builder, values):
+    builder.PrependUOffsetTRelativeSlot(3, values, 0)
+
+
+def VariableWithValuesEnd(builder):
+    return builder.EndObject()
+
+
+def VariablesWithTimeStart(builder):
+    builder.StartObject(VARIABLES_WITH_TIME_FIELDS)
+
+
+def VariablesWithTimeAddTime(builder, time):
+    builder.PrependInt64Slot(0, time, 0)
+
+
+def VariablesWithTimeAddTimeEnd(builder, time_end):
+    builder.PrependInt64Slot(1, time_end, 0)
+
+
+def VariablesWithTimeAddInterval(builder, interval):
+    builder.PrependInt32Slot(2, interval, 0)
+
+
+def VariablesWithTimeAddVariables(builder, variables):
+    builder.PrependUOffsetTRelativeSlot(3, variables, 0)
+
+
+def VariablesWithTimeStartVariablesVector(builder, num_elems):
+    return builder.StartVector(4, num_elems, 4)
+
+
+def VariablesWithTimeEnd(builder):
+    return builder.EndObject()
+
+
+def WeatherApiResponseStart(builder):
+    builder.StartObject(WEATHER_API_RESPONSE_FIELDS)
+
+
+def WeatherApiResponseAddLatitude(builder, latitude):
+    builder.PrependFloat32Slot(0, latitude, 0.0)
+
+
+def WeatherApiResponseAddLongitude(builder, longitude):
+    builder.PrependFloat32Slot(1, longitude, 0.0)
+
+
+def WeatherApiResponseAddUtcOffsetSeconds(builder, utc_offset_seconds):
+    builder.PrependInt32Slot(6, utc_offset_seconds, 0)
+
+
+def WeatherApiResponseAddHourly(builder, hourly):
+    builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+
+
+def WeatherApiResponseEnd(builder):
+    return builder.EndObject()
@@ -0,0 +1,246 @@
+"""
+Local stand-in for Nominatim, the Open-Meteo archive API and the Mesonet ASOS service.
+
+Responses are built from a recordings directory when one is given and
+synthesized otherwise. nominatim.json maps each query to its recorded
+response; openmeteo.bin is one recorded archive response whose hourly values
+are replayed at the requested locations and dates; asos.csv is replayed as is.
+Every route can add latency and answer a fraction of requests with 429, so
+the scheduler's retry path is exercised too.
+
+    server = StubServer(latency=0.05, error_rate=0.02).start()
+    os.environ.update(server.environ())
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+import flatbuffers
+import numpy as np
+
+import openmeteo_builders as om
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+
+def _query_list(query: dict, name: str) -> list[str]:
+    # requests sends lists as repeated keys; the real APIs also accept comma separated values
+    return [value for item in query.get(name, []) for value in item.split(',') if value]
+
+
+def _seeded(*parts) -> np.random.Generator:
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode()).digest()
+    return np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+
+
+def synthetic_coordinates(query: str):
+    # Deterministic point in Texas per lake name; roughly 2% of names don't resolve
+    rng = _seeded(query)
+    if rng.random() < 0.02:
+        return None
+    return float(rng.uniform(26.0, 36.5)), float(rng.uniform(-106.5, -93.5))
+
+
+def recorded_series(body: bytes) -> np.ndarray:
+    # Hourly values, shaped (variables, hours), of the first response in a recorded archive body
+    size = int.from_bytes(body[:4], 'little')
+    hourly = WeatherApiResponse.GetRootAs(body[4:4 + size], 0).Hourly()
+    return np.stack([hourly.Variables(i).ValuesAsNumpy() for i in range(hourly.VariablesLength())])
+
+
+def synthetic_archive(latitudes, longitudes, start_date: str, end_date: str, variables: int, timezone: str,
+                      recorded: np.ndarray = None) -> bytes:
+    """
+    Build a size-prefixed FlatBuffers body with one WeatherApiResponse per location.
+
+    Values are random unless `recorded` (as returned by recorded_series) is
+    given, in which case its series are repeated to fill the requested hours.
+    """
+    tz = ZoneInfo(timezone)
+    start = int(datetime.combine(date.fromisoformat(start_date), datetime.min.time(), tz).timestamp())
+    end = int(datetime.combine(date.fromisoformat(end_date) + timedelta(days=1), datetime.min.time(), tz).timestamp())
+    hours = (end - start) // 3600
+    body = bytearray()
+    for lat, lon in zip(latitudes, longitudes):
+        rng = _seeded(lat, lon, start_date)
+        builder = flatbuffers.Builder(1024 + hours * variables * 4)
+        offsets = []
+        for i in range(variables):
+            series = rng.normal(50, 10, hours) if recorded is None else np.resize(recorded[i % len(recorded)], hours)
+            values = builder.CreateNumpyVector(series.astype(np.float32))
+            om.VariableWithValuesStart(builder)
+            om.VariableWithValuesAddValues(builder, values)
+            offsets.append(om.VariableWithValuesEnd(builder))
+        om.VariablesWithTimeStartVariablesVector(builder, len(offsets))
+        for offset in reversed(offsets):
+            builder.PrependUOffsetTRelative(offset)
+        variable_vector = builder.EndVector()
+        om.VariablesWithTimeStart(builder)
+        om.VariablesWithTimeAddTime(builder, start)
+        om.VariablesWithTimeAddTimeEnd(builder, end)
+        om.VariablesWithTimeAddInterval(builder, 3600)
+        om.VariablesWithTimeAddVariables(builder, variable_vector)
+        hourly = om.VariablesWithTimeEnd(builder)
+        om.WeatherApiResponseStart(builder)
+        om.WeatherApiResponseAddLatitude(builder, float(lat))
+        om.WeatherApiResponseAddLongitude(builder, float(lon))
+        offset = int(datetime.fromtimestamp(start, tz).utcoffset().total_seconds())
+        om.WeatherApiResponseAddUtcOffsetSeconds(builder, offset)
+        om.WeatherApiResponseAddHourly(builder, hourly)
+        builder.FinishSizePrefixed(om.WeatherApiResponseEnd(builder))
+        body += builder.Output()
+    return bytes(body)
+
+
+def synthetic_asos(stations, start: date, end: date) -> bytes:
+    # Same columns as asos_request.params asks for (onlycomma, latlon, elev)
+    lines = ['station,valid,lon,lat,elevation,tmpf,mslp,sknt,skyc1,skyc2,skyc3,skyc4']
+    sky = ['CLR', 'FEW', 'SCT', 'BKN', 'OVC', 'M']
+    for station in stations:
+        rng = _seeded(station)
+        lat, lon = rng.uniform(26.0, 36.5), rng.uniform(-106.5, -93.5)
+        current = datetime.combine(start, datetime.min.time())
+        while current.date() < end:
+            mslp = f"{rng.normal(1015, 6):.1f}" if rng.random() > 0.3 else 'M'
+            lines.append(f"{station},{current:%Y-%m-%d %H:%M},{lon:.4f},{lat:.4f},100.0,{rng.normal(65, 15):.1f},"
+                         f"{mslp},{rng.integers(0, 25)},{','.join(rng.choice(sky, 4))}")
+            current += timedelta(minutes=60)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class StubServer:
+    """
+    Threaded HTTP stub serving /search (Nominatim), /v1/archive (Open-Meteo) and /cgi-bin/request/asos.py.
+
+    Args:
+        latency: Seconds added to every response.
+        error_rate: Fraction of requests answered with 429, Retry-After: 0 and an Open-Meteo style error body.
+        recordings: Optional directory with nominatim.json, openmeteo.bin and/or asos.csv to replay (see above).
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, recordings: Path = None, port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.recordings = Path(recordings) if recordings else None
+        self.requests = Counter()
+        self.errors = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self) -> dict:
+        # Endpoints read by geoloc, open_meteo and asos_download; set them before those modules are used
+        host, port = self.httpd.server_address[:2]
+        return {
+            'NOMINATIM_DOMAIN': f"{host}:{port}",
+            'NOMINATIM_SCHEME': 'http',
+            'OPEN_METEO_ARCHIVE_URL': f"{self.url}/v1/archive",
+            'MESONET_ASOS_URL': f"{self.url}/cgi-bin/request/asos.py",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.errors.clear()
+
+    def _recording(self, name: str):
+        if self.recordings and (self.recordings / name).exists():
+            return (self.recordings / name).read_bytes()
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                routes = {
+                    '/search': ('nominatim', self.nominatim),
+                    '/v1/archive': ('open-meteo', self.archive),
+                    '/cgi-bin/request/asos.py': ('mesonet', self.asos),
+                }
+                if url.path not in routes:
+                    self.send_error(404)
+                    return
+                provider, route = routes[url.path]
+                with server.lock:
+                    server.requests[provider] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if random.random() < server.error_rate:
+                    with server.lock:
+                        server.errors[provider] += 1
+                    # Same reason text Open-Meteo sends when a quota is exhausted
+                    body = json.dumps({'error': True, 'reason': 'Minutely API request limit exceeded.'}).encode()
+                    self.send_response(429)
+                    self.send_header('Retry-After', '0')
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                content_type, body = route(query)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def nominatim(self, query):
+                name = query.get('q', [''])[0]
+                # Recorded responses are keyed by query; other lakes are synthesized
+                recorded = json.loads(server._recording('nominatim.json') or '{}')
+                if name in recorded:
+                    return 'application/json', json.dumps(recorded[name]).encode()
+                coords = synthetic_coordinates(name)
+                results = [] if coords is None else [{
+                    'place_id': 1, 'lat': str(coords[0]), 'lon': str(coords[1]), 'display_name': name,
+                    'boundingbox': [str(coords[0]), str(coords[0]), str(coords[1]), str(coords[1])],
+                }]
+                return 'application/json', json.dumps(results).encode()
+
+            def archive(self, query):
+                latitudes = _query_list(query, 'latitude')
+                longitudes = _query_list(query, 'longitude')
+                recorded = server._recording('openmeteo.bin')
+                # Recorded values are replayed at the requested locations and dates, so the caches key them correctly
+                series = recorded_series(recorded) if recorded is not None else None
+                body = synthetic_archive(latitudes, longitudes, query['start_date'][0], query['end_date'][0],
+                                         len(_query_list(query, 'hourly')), query.get('timezone', ['GMT'])[0],
+                                         series)
+                return 'application/octet-stream', body
+
+            def asos(self, query):
+                recorded = server._recording('asos.csv')
+                if recorded is not None:
+                    return 'text/csv', recorded
+                start = date(int(query['year1'][0]), int(query['month1'][0]), int(query['day1'][0]))
+                end = date(int(query['year2'][0]), int(query['month2'][0]), int(query['day2'][0]))
+                return 'text/csv', synthetic_asos(_query_list(query, 'station'), start, end)
+
+        return Handler
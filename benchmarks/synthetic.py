@@ -0,0 +1,48 @@
+"""
+Synthetic ShareLunker exports for benchmarking.
+
+    python benchmarks/synthetic.py --rows 100000 --out sharelunker_synthetic_100k.csv
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def generate_export(path: Path, rows: int, lakes: int = 300, start: str = '1990-01-01', end: str = '2025-07-01',
+                    seed: int = 0) -> Path:
+    """
+    Write a CSV shaped like the ShareLunker export that main.get_lunker_data reads.
+
+    The first line is a title row, catches cluster in January-April like real
+    lunker submissions, and lake popularity is skewed so a few lakes dominate.
+    """
+    rng = np.random.default_rng(seed)
+    # Zipf-like popularity: Lake Fork style outliers plus a long tail
+    weights = 1 / np.arange(1, lakes + 1) ** 0.8
+    lake = rng.choice(lakes, size=rows, p=weights / weights.sum())
+    days = pd.date_range(start, end, freq='D')
+    spring = days[days.month <= 4]
+    dates = np.where(rng.random(rows) < 0.8, rng.choice(spring, rows), rng.choice(days, rows))
+    df = pd.DataFrame({
+        'Lake_Name': [f"Benchmark Lake {i}" for i in lake],
+        'Date': pd.DatetimeIndex(dates).strftime('%m/%d/%Y'),
+        'Weight': rng.uniform(13, 18, rows).round(2),
+        'Length': rng.uniform(24, 28, rows).round(2),
+        'Angler': rng.integers(0, rows // 3 + 1, rows).astype(str),
+    })
+    path = Path(path)
+    with open(path, 'w') as f:
+        f.write("ShareLunker synthetic export\n")
+        df.to_csv(f, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--lakes', type=int, default=300)
+    parser.add_argument('--out', type=Path, default=Path('sharelunker_synthetic.csv'))
+    args = parser.parse_args()
+    print(f"Wrote {generate_export(args.out, args.rows, args.lakes)}")
@@ -0,0 +1,181 @@
+import argparse
+import os
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from grid import GRID_SPACING, snap
+
+WEATHER_COLUMNS = ['noon_temperature_2m', 'noon_cloud_cover', 'noon_rain', 'noon_snowfall',
+                   'noon_surface_pressure', 'noon_pressure_msl', 'noon_wind_speed_10m']
+# PRAGMA user_version of a store whose weather keys are grid cells; older stores are re-keyed on open
+SCHEMA_VERSION = 1
+
+
+def _real(value):
+    # sqlite3 cannot bind numpy scalars
+    return None if value is None else float(value)
+
+
+class CacheStore:
+    """
+    SQLite (WAL mode) store for geocode and weather results.
+
+    Every put is committed on its own, so a killed job loses at most the
+    result in flight. Lookups go through the primary-key index instead of
+    loading the whole cache, and each thread/process gets its own connection
+    so concurrent workers can share one file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS geocode (
+                lake_name TEXT PRIMARY KEY,
+                lat REAL,
+                lon REAL
+            );
+            CREATE TABLE IF NOT EXISTS weather (
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                date TEXT NOT NULL,
+                {', '.join(f'{col} REAL' for col in WEATHER_COLUMNS)},
+                PRIMARY KEY (lat, lon, date)
+            );
+        """)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            rekey_weather(self)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_geocodes(self, lake_names) -> dict:
+        """Return {lake_name: (lat, lon)} for the names already cached; failed lookups map to (None, None)."""
+        found = {}
+        names = list(lake_names)
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(names), 500):
+            chunk = names[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT lake_name, lat, lon FROM geocode WHERE lake_name IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((name, (lat, lon)) for name, lat, lon in rows)
+        return found
+
+    def put_geocode(self, lake_name: str, lat, lon) -> None:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)", (lake_name, _real(lat), _real(lon)))
+
+    def _with_keys(self, keys, query: str, read=None):
+        # Join the requested keys against the index through a temp table instead of one query per key
+        conn = self.conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (lat REAL, lon REAL, date TEXT)")
+        conn.execute("DELETE FROM wanted")
+        conn.executemany("INSERT INTO wanted VALUES (?, ?, ?)", keys)
+        rows = read(query, conn) if read else conn.execute(query).fetchall()
+        conn.execute("DELETE FROM wanted")
+        conn.commit()
+        return rows
+
+    def missing_weather(self, keys) -> list:
+        """Return the (lat, lon, date) keys that are not cached yet, in input order."""
+        keys = [(float(lat), float(lon), date) for lat, lon, date in keys]
+        present = set(self._with_keys(keys, """
+            SELECT w.lat, w.lon, w.date FROM wanted w
+            JOIN weather USING (lat, lon, date)
+        """))
+        return [key for key in keys if key not in present]
+
+    def weather_frame(self, keys) -> pd.DataFrame:
+        """
+        Return the cached weather for keys as a typed DataFrame ready to merge.
+
+        Key columns are lat/lon (float64, so they match the catch table exactly)
+        and a categorical date_str; weather columns are float32.
+        """
+        keys = [(float(lat), float(lon), date) for lat, lon, date in keys]
+        frame = self._with_keys(keys, f"""
+            SELECT weather.lat, weather.lon, weather.date AS date_str,
+                   {', '.join(f'weather.{col}' for col in WEATHER_COLUMNS)}
+            FROM wanted JOIN weather USING (lat, lon, date)
+        """, read=pd.read_sql_query)
+        return frame.astype({'lat': 'float64', 'lon': 'float64', 'date_str': 'category',
+                             **{col: 'float32' for col in WEATHER_COLUMNS}})
+
+    def put_weather(self, key, weather_data: dict) -> None:
+        lat, lon, date = key
+        with self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO weather VALUES (?, ?, ?, {', '.join('?' * len(WEATHER_COLUMNS))})",
+                (float(lat), float(lon), date, *(_real(weather_data[col]) for col in WEATHER_COLUMNS)))
+
+
+def rekey_weather(store: CacheStore, spacing: float = GRID_SPACING) -> int:
+    """
+    Move weather rows keyed by exact lake coordinates onto their grid cell centres.
+
+    Keeps one row per (cell, date): a row already stored for the cell wins,
+    otherwise the one closest to the cell centre. Rows already on the grid are
+    left alone, so running it again is a no-op. Returns the number of rows moved.
+    """
+    conn = store.conn
+    frame = pd.read_sql_query("SELECT rowid, lat, lon, date FROM weather", conn)
+    cell_lat, cell_lon, _ = snap(frame['lat'], frame['lon'], spacing)
+    off_grid = (frame['lat'].to_numpy() != cell_lat) | (frame['lon'].to_numpy() != cell_lon)
+    moved = frame[off_grid].assign(cell_lat=cell_lat[off_grid], cell_lon=cell_lon[off_grid])
+    if moved.empty:
+        return 0
+    distance = (moved['lat'] - moved['cell_lat']) ** 2 + (moved['lon'] - moved['cell_lon']) ** 2
+    keep = moved.loc[distance.sort_values(kind='stable').index].drop_duplicates(['cell_lat', 'cell_lon', 'date'])
+    copies = [(float(lat), float(lon), int(rowid))
+              for lat, lon, rowid in keep[['cell_lat', 'cell_lon', 'rowid']].itertuples(index=False)]
+    with conn:
+        conn.executemany(
+            f"INSERT OR IGNORE INTO weather SELECT ?, ?, date, {', '.join(WEATHER_COLUMNS)} FROM weather WHERE rowid = ?",
+            copies)
+        conn.executemany("DELETE FROM weather WHERE rowid = ?", [(int(rowid),) for rowid in moved['rowid']])
+    print(f"Re-keyed {len(moved)} weather entries onto {len(keep)} grid cell entries")
+    return len(moved)
+
+
+def migrate_pickles(store: CacheStore, geocode_pkl: Path = None, weather_pkl: Path = None) -> None:
+    # One-shot import of the old whole-file pickle caches
+    if geocode_pkl and os.path.exists(geocode_pkl):
+        with open(geocode_pkl, 'rb') as f:
+            geocode_dict = pickle.load(f)
+        rows = [(name, *map(_real, coords or (None, None))) for name, coords in geocode_dict.items()]
+        with store.conn:
+            store.conn.executemany("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)", rows)
+        print(f"Migrated {len(rows)} geocode entries from {geocode_pkl}")
+    if weather_pkl and os.path.exists(weather_pkl):
+        with open(weather_pkl, 'rb') as f:
+            weather_dict = pickle.load(f)
+        rows = [(float(lat), float(lon), date, *(_real(data[col]) for col in WEATHER_COLUMNS))
+                for (lat, lon, date), data in weather_dict.items()]
+        with store.conn:
+            store.conn.executemany(
+                f"INSERT OR REPLACE INTO weather VALUES (?, ?, ?, {', '.join('?' * len(WEATHER_COLUMNS))})", rows)
+        print(f"Migrated {len(rows)} weather entries from {weather_pkl}")
+        # The pickles are keyed by exact lake coordinates
+        rekey_weather(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the pickle caches into a SQLite cache store")
+    parser.add_argument('--db', type=Path, default=Path('lunker_cache.sqlite'))
+    parser.add_argument('--geocode', type=Path, default=Path('geocode_cache.pkl'))
+    parser.add_argument('--weather', type=Path, default=Path('weather_cache.pkl'))
+    args = parser.parse_args()
+    migrate_pickles(CacheStore(args.db), args.geocode, args.weather)
@@ -0,0 +1,184 @@
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from grid import catch_timestamps
+from hourly_store import HourlyStore
+from metrics import stage
+
+WINDOW_HOURS = (24, 48, 72)
+# Pressure deltas compare against the day before the oldest window day
+LOOKBACK_DAYS = max(WINDOW_HOURS) // 24
+DAILY_COLUMNS = ['pressure', 'rain', 'wind_max', 'temp_max', 'temp_min']
+FEATURE_COLUMNS = [
+    *(f'{name}_{hours}h' for name in ['pressure_delta', 'rain', 'wind_max', 'temp_swing'] for hours in WINDOW_HOURS),
+    'sun_elevation', 'sun_azimuth', 'moon_elevation', 'moon_illumination', 'moon_phase',
+]
+# Epoch the almanac formulas count days from (J2000.0)
+J2000 = pd.Timestamp('2000-01-01 12:00', tz='UTC')
+
+
+def lookback_keys(keys, days: int = LOOKBACK_DAYS + 1) -> list:
+    """
+    Expand (lat, lon, date_str) keys with the days their feature windows reach back into.
+
+    The default is one day more than LOOKBACK_DAYS because the oldest
+    day's window starts at noon the day before it.
+    """
+    expanded = set()
+    for lat, lon, date_str in keys:
+        day = date.fromisoformat(date_str)
+        expanded.update((lat, lon, (day - timedelta(days=i)).isoformat()) for i in range(days + 1))
+    return sorted(expanded)
+
+
+class DailyAggregates:
+    """
+    Memo of per-(cell, day) weather aggregates, computed from an HourlyStore.
+
+    Each day covers the 24 hours ending at local `hour` on that date (the
+    time catches are lined up to), so every window is a combination of whole
+    days and catches on overlapping dates share them. Only complete days are
+    memoized; a day with uncached hours is recomputed once its hours arrive.
+    """
+
+    def __init__(self, hourly: HourlyStore, hour: int = 12):
+        self.hourly = hourly
+        self.hour = hour
+        self.memo = pd.DataFrame(columns=DAILY_COLUMNS, dtype='float32',
+                                 index=pd.MultiIndex.from_tuples([], names=['lat', 'lon', 'date_str']))
+
+    def get(self, keys: pd.DataFrame) -> pd.DataFrame:
+        """Return DAILY_COLUMNS for each row of keys (lat, lon, date_str), in the same order."""
+        index = pd.MultiIndex.from_frame(keys[['lat', 'lon', 'date_str']])
+        missing = keys[~index.isin(self.memo.index)].drop_duplicates().dropna().reset_index(drop=True)
+        computed = self._compute(missing)
+        complete = computed.notna().all(axis=1)
+        self.memo = pd.concat([self.memo, computed[complete]])
+        return pd.concat([self.memo, computed[~complete]]).reindex(index)
+
+    def _compute(self, keys: pd.DataFrame) -> pd.DataFrame:
+        index = pd.MultiIndex.from_frame(keys[['lat', 'lon', 'date_str']])
+        if keys.empty:
+            return pd.DataFrame(columns=DAILY_COLUMNS, index=index, dtype='float32')
+        points = pd.DataFrame({'lat': keys['lat'], 'lon': keys['lon'], 'timestamp': catch_timestamps(keys, self.hour)})
+        # Hourly values are totals/means over the preceding hour, so offsets -23..0 cover the 24 h ending at `hour`
+        offsets = np.arange(-23, 1)
+        hours = self.hourly.at(points, offsets)
+        rows = hours['point'].to_numpy()
+        cols = hours['offset'].to_numpy() - offsets[0]
+        series = {}
+        for variable in ['pressure_msl', 'rain', 'wind_speed_10m', 'temperature_2m']:
+            grid = np.full((len(points), len(offsets)), np.nan, dtype=np.float32)
+            grid[rows, cols] = hours[variable].to_numpy(dtype=np.float32)
+            series[variable] = grid
+        # Plain sum/max/min so a day with any missing hour comes out NaN rather than partial
+        return pd.DataFrame({
+            'pressure': series['pressure_msl'][:, -1],
+            'rain': series['rain'].sum(axis=1),
+            'wind_max': series['wind_speed_10m'].max(axis=1),
+            'temp_max': series['temperature_2m'].max(axis=1),
+            'temp_min': series['temperature_2m'].min(axis=1),
+        }, index=index)
+
+
+@lru_cache(maxsize=None)
+def daily_aggregates(hourly_dir: Path) -> DailyAggregates:
+    # One memo per store and process, shared by every chunk and partition it enriches
+    return DailyAggregates(HourlyStore(hourly_dir))
+
+
+def window_features(catches: pd.DataFrame, aggregates: DailyAggregates) -> pd.DataFrame:
+    """
+    Rolling-window features for unique (lat, lon, date_str) catch keys.
+
+    Returns one row per key with the pressure_delta_*, rain_*, wind_max_* and
+    temp_swing_* columns; windows with any uncached hour are NaN.
+    """
+    dates = pd.to_datetime(catches['date_str'], format='%Y-%m-%d')
+    days = pd.concat([
+        catches[['lat', 'lon']].assign(date_str=(dates - pd.Timedelta(days=i)).dt.strftime('%Y-%m-%d'))
+        for i in range(LOOKBACK_DAYS + 1)
+    ], ignore_index=True)
+    daily = aggregates.get(days)
+    # (days back, catches) arrays; day 0 is the catch day
+    values = {column: daily[column].to_numpy(dtype=np.float32).reshape(LOOKBACK_DAYS + 1, len(catches))
+              for column in DAILY_COLUMNS}
+    features = {}
+    for hours in WINDOW_HOURS:
+        n = hours // 24
+        features[f'pressure_delta_{hours}h'] = values['pressure'][0] - values['pressure'][n]
+        features[f'rain_{hours}h'] = values['rain'][:n].sum(axis=0)
+        features[f'wind_max_{hours}h'] = values['wind_max'][:n].max(axis=0)
+        features[f'temp_swing_{hours}h'] = values['temp_max'][:n].max(axis=0) - values['temp_min'][:n].min(axis=0)
+    return pd.DataFrame(features, index=catches.index)
+
+
+def _equatorial(ecliptic_lon, ecliptic_lat, days):
+    obliquity = np.radians(23.439 - 0.0000004 * days)
+    ra = np.arctan2(np.sin(ecliptic_lon) * np.cos(obliquity) - np.tan(ecliptic_lat) * np.sin(obliquity),
+                    np.cos(ecliptic_lon))
+    dec = np.arcsin(np.sin(ecliptic_lat) * np.cos(obliquity)
+                    + np.cos(ecliptic_lat) * np.sin(obliquity) * np.sin(ecliptic_lon))
+    return ra, dec
+
+
+def _horizontal(ra, dec, days, lat, lon):
+    # Elevation and azimuth (clockwise from north) in degrees
+    sidereal = np.radians((280.46061837 + 360.98564736629 * days) % 360)
+    hour_angle = sidereal + np.radians(lon) - ra
+    phi = np.radians(lat)
+    elevation = np.arcsin(np.sin(phi) * np.sin(dec) + np.cos(phi) * np.cos(dec) * np.cos(hour_angle))
+    azimuth = np.arctan2(-np.sin(hour_angle), np.tan(dec) * np.cos(phi) - np.sin(phi) * np.cos(hour_angle))
+    return np.degrees(elevation), np.degrees(azimuth) % 360
+
+
+def astronomy(lat, lon, timestamps: pd.Series) -> pd.DataFrame:
+    """
+    Sun and moon position at each timestamp, from low-precision almanac formulas (~1 degree).
+
+    moon_illumination is the lit fraction of the disc; moon_phase runs 0 (new) -> 0.5 (full) -> 1.
+    """
+    days = ((timestamps - J2000) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    anomaly = np.radians(357.529 + 0.98560028 * days)
+    sun_lon = np.radians((280.459 + 0.98564736 * days + 1.915 * np.sin(anomaly) + 0.020 * np.sin(2 * anomaly)) % 360)
+    sun_elevation, sun_azimuth = _horizontal(*_equatorial(sun_lon, 0.0, days), days, lat, lon)
+    moon_anomaly = np.radians(134.963 + 13.064993 * days)
+    moon_node = np.radians(93.272 + 13.229350 * days)
+    moon_lon = np.radians(218.316 + 13.176396 * days + 6.289 * np.sin(moon_anomaly))
+    moon_lat = np.radians(5.128 * np.sin(moon_node))
+    moon_elevation, _ = _horizontal(*_equatorial(moon_lon, moon_lat, days), days, lat, lon)
+    return pd.DataFrame({
+        'sun_elevation': sun_elevation,
+        'sun_azimuth': sun_azimuth,
+        'moon_elevation': moon_elevation,
+        'moon_illumination': (1 - np.cos(moon_lat) * np.cos(moon_lon - sun_lon)) / 2,
+        'moon_phase': ((moon_lon - sun_lon) % (2 * np.pi)) / (2 * np.pi),
+    }, index=timestamps.index)
+
+
+@stage('get_weather_features')
+def get_weather_features(df: pd.DataFrame, aggregates: DailyAggregates) -> pd.DataFrame:
+    """
+    Add pressure trend, multi-day weather window and sun/moon features to each catch.
+
+    Windows are computed once per unique (cell, date) and joined back, so
+    every catch on the same lake and day shares one computation.
+
+    Args:
+        df: Catch table with lat, lon, cell_lat, cell_lon and date_str.
+        aggregates: Per-(cell, day) memo over the hourly store; reuse it across chunks.
+    """
+    df = df.drop(columns=FEATURE_COLUMNS, errors='ignore')
+    catches = df[['cell_lat', 'cell_lon', 'date_str']].dropna().drop_duplicates().reset_index(drop=True)
+    catches = catches.rename(columns={'cell_lat': 'lat', 'cell_lon': 'lon'})
+    windows = pd.concat([catches, window_features(catches, aggregates)], axis=1)
+    windows = windows.rename(columns={'lat': 'cell_lat', 'lon': 'cell_lon'})
+    df = df.merge(windows, on=['cell_lat', 'cell_lon', 'date_str'], how='left')
+    sky = astronomy(df['lat'], df['lon'], catch_timestamps(df))
+    return pd.concat([df, sky.astype('float32')], axis=1)
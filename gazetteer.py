@@ -0,0 +1,150 @@
+import argparse
+import csv
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+# Words that describe the kind of water body rather than which one it is
+GENERIC_WORDS = {'lake', 'lakes', 'reservoir', 'the', 'of', 'pond', 'tank'}
+ABBREVIATIONS = {'lk': 'lake', 'res': 'reservoir', 'resv': 'reservoir', 'st': 'saint', 'mt': 'mount', 'ft': 'fort'}
+
+DEFAULT_GAZETTEER = Path(os.environ.get('LAKE_GAZETTEER', 'lake_gazetteer.csv'))
+
+
+def normalize(name: str) -> str:
+    """
+    Canonical form of a lake name for matching.
+
+    Lower-cases, strips accents and punctuation, expands common abbreviations
+    and turns inverted names around, so "Fork, Lake" and "LAKE FORK" compare equal.
+    """
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().lower()
+    # "Fork, Lake" -> "Lake Fork"
+    if name.count(',') == 1:
+        head, tail = (part.strip() for part in name.split(','))
+        if tail and set(tail.split()) <= GENERIC_WORDS:
+            name = f"{tail} {head}"
+    name = re.sub(r"[^a-z0-9 ]+", ' ', name.replace("'", ''))
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in name.split())
+
+
+def core_name(normalized: str) -> str:
+    # "lake fork reservoir" -> "fork"; falls back to the full name if it is all generic words
+    core = ' '.join(word for word in normalized.split() if word not in GENERIC_WORDS)
+    return core or normalized
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """
+    Offline lake name -> (lat, lon) lookup.
+
+    Lookups try the exact normalized name, then the name without generic words
+    ("Lake Fork Reservoir" -> "fork"), then a fuzzy match over a prebuilt
+    trigram index of the core names.
+
+    Args:
+        entries: Iterable of (name, lat, lon, aliases) with aliases a list of alternative names.
+        min_similarity: Smallest trigram Jaccard similarity accepted for a fuzzy match.
+    """
+
+    def __init__(self, entries, min_similarity: float = 0.6):
+        self.min_similarity = min_similarity
+        self.names = []
+        self.coords = []
+        self.exact = defaultdict(set)
+        self.core = defaultdict(set)
+        self.index = defaultdict(set)
+        self.core_trigrams = {}
+        for name, lat, lon, aliases in entries:
+            entry = len(self.names)
+            self.names.append(name)
+            self.coords.append((float(lat), float(lon)))
+            for alias in [name, *aliases]:
+                normalized = normalize(alias)
+                self.exact[normalized].add(entry)
+                core = core_name(normalized)
+                self.core[core].add(entry)
+                if core not in self.core_trigrams:
+                    self.core_trigrams[core] = trigrams(core)
+                    for gram in self.core_trigrams[core]:
+                        self.index[gram].add(core)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_csv(cls, path: Path, **kwargs):
+        """Load a CSV with name, lat, lon and an optional '|' separated aliases column."""
+        with open(path, newline='') as f:
+            rows = [(row['name'], row['lat'], row['lon'], [a for a in (row.get('aliases') or '').split('|') if a])
+                    for row in csv.DictReader(f)]
+        return cls(rows, **kwargs)
+
+    @classmethod
+    def from_gnis(cls, path: Path, state: str = 'TX', feature_classes=('Reservoir', 'Lake'), **kwargs):
+        """Load lakes and reservoirs for one state from a pipe-delimited GNIS domestic names file."""
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows = [(row['FEATURE_NAME'], row['PRIM_LAT_DEC'], row['PRIM_LONG_DEC'], [])
+                    for row in csv.DictReader(f, delimiter='|')
+                    if row['STATE_ALPHA'] == state and row['FEATURE_CLASS'] in feature_classes
+                    and float(row['PRIM_LAT_DEC'] or 0) != 0]
+        return cls(rows, **kwargs)
+
+    def to_csv(self, path: Path) -> None:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'lat', 'lon', 'aliases'])
+            for name, (lat, lon) in zip(self.names, self.coords):
+                writer.writerow([name, lat, lon, ''])
+
+    def _unique(self, entries):
+        # Several lakes sharing a name ("Clear Lake") or core name ("Lake Creek") is ambiguous; leave those to Nominatim
+        return self.coords[next(iter(entries))] if len(entries) == 1 else None
+
+    def lookup(self, name: str):
+        """Return (lat, lon) for a lake name, or None if it can't be resolved unambiguously offline."""
+        normalized = normalize(name)
+        if normalized in self.exact:
+            return self._unique(self.exact[normalized])
+        core = core_name(normalized)
+        if core in self.core:
+            return self._unique(self.core[core])
+        grams = trigrams(core)
+        shared = Counter(candidate for gram in grams for candidate in self.index.get(gram, ()))
+        best, best_score = None, 0.0
+        for candidate, overlap in shared.items():
+            score = overlap / (len(grams) + len(self.core_trigrams[candidate]) - overlap)
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None and best_score >= self.min_similarity:
+            return self._unique(self.core[best])
+        return None
+
+
+@lru_cache(maxsize=None)
+def load_gazetteer(path: Path = DEFAULT_GAZETTEER) -> Gazetteer:
+    # An absent file just means every lake goes to Nominatim
+    if not os.path.exists(path):
+        return Gazetteer([])
+    gazetteer = Gazetteer.from_csv(path)
+    print(f"Loaded gazetteer with {len(gazetteer)} lakes from {path}")
+    return gazetteer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the lake gazetteer CSV from a GNIS domestic names file")
+    parser.add_argument('gnis', type=Path, help="pipe-delimited GNIS file, e.g. DomesticNames_TX.txt")
+    parser.add_argument('--state', default='TX')
+    parser.add_argument('--out', type=Path, default=DEFAULT_GAZETTEER)
+    args = parser.parse_args()
+    gazetteer = Gazetteer.from_gnis(args.gnis, state=args.state)
+    gazetteer.to_csv(args.out)
+    print(f"Wrote {len(gazetteer)} lakes to {args.out}")
@@ -1,11 +1,34 @@
-from geopy.geocoders import Nominatim
+import os
+import threading
 
-geolocator = Nominatim(user_agent="lake_weather_app")
+from gazetteer import load_gazetteer
+
+_geolocator = None
+_geolocator_lock = threading.Lock()
+
+def get_geolocator():
+    # Built on first use so lakes resolved from the caches or gazetteer never import geopy
+    global _geolocator
+    with _geolocator_lock:
+        if _geolocator is None:
+            from geopy.geocoders import Nominatim
+            # Overridable so benchmarks can point the geocoder at a local stub server
+            _geolocator = Nominatim(user_agent="lake_weather_app",
+                                    domain=os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org'),
+                                    scheme=os.environ.get('NOMINATIM_SCHEME', 'https'))
+        return _geolocator
+
+# ShareLunker lakes are all in Texas; every caller uses the same query so results agree
+QUERY_SUFFIX = ", Texas, USA"
 
 def get_coordinates(location: str) -> tuple[float, float]:
-    location_obj = geolocator.geocode(f"{location}, USA")
+    location_obj = get_geolocator().geocode(f"{location}{QUERY_SUFFIX}")
     if not location_obj:
         raise ValueError(f"Could not geocode {location}")
     lat = location_obj.latitude
     lon = location_obj.longitude
-    return lat, lon
\ No newline at end of file
+    return lat, lon
+
+def lookup_offline(location: str):
+    # (lat, lon) from the local gazetteer, or None if the lake isn't in it
+    return load_gazetteer().lookup(location)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+# Open-Meteo serves historical data from ~9 km (0.1 degree) ERA5-Land/IFS cells,
+# so every coordinate inside a cell gets the same series
+GRID_SPACING = 0.1
+# Catch dates are local to Texas
+CATCH_TIMEZONE = 'America/Chicago'
+
+
+def snap(lat, lon, spacing: float = GRID_SPACING):
+    """
+    Snap coordinates to the centre of their grid cell.
+
+    Args:
+        lat, lon: Scalars or arrays in degrees.
+        spacing: Grid spacing in degrees.
+
+    Returns:
+        Tuple (cell_lat, cell_lon, cell_id); cell_id is "<row>_<col>" of integer cell indices.
+    """
+    row = np.round(np.asarray(lat, dtype=np.float64) / spacing).astype(np.int64)
+    col = np.round(np.asarray(lon, dtype=np.float64) / spacing).astype(np.int64)
+    # Round the centres so the same cell always produces bit-identical cache keys
+    cell_lat = np.round(row * spacing, 6)
+    cell_lon = np.round(col * spacing, 6)
+    cell_id = np.char.add(np.char.add(row.astype(str), '_'), col.astype(str))
+    return cell_lat, cell_lon, cell_id
+
+
+def add_grid_cells(df: pd.DataFrame, spacing: float = GRID_SPACING) -> pd.DataFrame:
+    """Add cell_id, cell_lat and cell_lon next to lat/lon; rows without coordinates get missing cells."""
+    df = df.copy()
+    located = df['lat'].notna() & df['lon'].notna()
+    cell_lat, cell_lon, cell_id = snap(df.loc[located, 'lat'], df.loc[located, 'lon'], spacing)
+    df['cell_id'] = pd.Series(cell_id, index=df.index[located], dtype='object')
+    df['cell_lat'] = pd.Series(cell_lat, index=df.index[located], dtype='float64')
+    df['cell_lon'] = pd.Series(cell_lon, index=df.index[located], dtype='float64')
+    return df
+
+
+def dedup_report(df: pd.DataFrame) -> dict:
+    # How many raw (lat, lon, date) fetches collapse into shared (cell, date) fetches
+    raw = len(df[['lat', 'lon', 'date_str']].dropna().drop_duplicates())
+    cells = len(df[['cell_id', 'date_str']].dropna().drop_duplicates())
+    hit_ratio = 1 - cells / raw if raw else 0.0
+    print(f"Grid snapping: {raw} (lat, lon, date) keys -> {cells} (cell, date) keys, hit ratio {hit_ratio:.1%}")
+    return {'raw_keys': raw, 'cell_keys': cells, 'hit_ratio': hit_ratio}
+
+
+def catch_timestamps(df: pd.DataFrame, hour: int = 12) -> pd.Series:
+    # Catches only carry a date, so use local noon to line up with the noon_* Open-Meteo columns
+    local = pd.to_datetime(df['date_str'], format='%Y-%m-%d', errors='coerce') + pd.Timedelta(hours=hour)
+    return local.dt.tz_localize(CATCH_TIMEZONE, ambiguous='NaT', nonexistent='shift_forward').dt.tz_convert('UTC')
@@ -1,5 +1,5 @@
 import requests
-from geopy.geocoders import Nominatim
+from geoloc import lookup_offline, get_coordinates
 from datetime import datetime, timedelta
 import time
 
@@ -10,9 +10,6 @@ def round_to_nearest_hour(dt):
         dt = dt + timedelta(hours=1)
     return dt.replace(minute=0, second=0, microsecond=0)
 
-# Initialize geocoder
-geolocator = Nominatim(user_agent="lake_weather_app")
-
 # Sample input: list of lakes and corresponding timestamps
 # User can edit these lists
 lakes = ["Lake Travis", "Lake Buchanan", "Canyon Lake"]
@@ -26,13 +23,17 @@ results = []
 
 for lake, timestamp_str in zip(lakes, timestamps):
     # Geocode the lake
-    query = f"{lake}, Texas"
-    location = geolocator.geocode(query)
-    if not location:
-        print(f"Could not geocode {lake}")
-        continue
-    lat = location.latitude
-    lon = location.longitude
+    # Local gazetteer first, then Nominatim with the same query the pipeline uses
+    coords = lookup_offline(lake)
+    if coords is None:
+        try:
+            coords = get_coordinates(lake)
+        except ValueError:
+            print(f"Could not geocode {lake}")
+            continue
+        # Respect Nominatim rate limit
+        time.sleep(1)
+    lat, lon = coords
 
     # Parse timestamp
     try:
@@ -87,9 +88,6 @@ for lake, timestamp_str in zip(lakes, timestamps):
         'barometric_pressure_hpa': pressure
     })
 
-    # Respect Nominatim rate limit
-    time.sleep(1)
-
 # Output results
 if results:
     print("Weather Data:")
@@ -0,0 +1,161 @@
+import math
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from open_meteo import HOURLY_VARIABLES, TIMEZONE
+
+
+def tile_id(lat: float, lon: float) -> str:
+    # 1 degree tiles keep partitions small enough to scan but few enough to list quickly
+    return f"{math.floor(lat)}_{math.floor(lon)}"
+
+
+def _utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp.tz_convert('UTC')
+
+
+class HourlyStore:
+    """
+    Partitioned Parquet dataset of full hourly Open-Meteo series.
+
+    Layout is hive style, ``<root>/tile=<lat>_<lon>/month=<YYYY-MM>/*.parquet``,
+    with one row per (lat, lon, time) and float32 weather columns. Queries only
+    open the tile/month partitions they need.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def write_arrays(self, coords, values, starts, interval: int) -> None:
+        """
+        Append decoded arrays from open_meteo.fetch_weather_arrays without building per-location frames.
+
+        Args:
+            coords: List of (lat, lon) tuples, one per response.
+            values: Array of shape (responses, variables, hours).
+            starts: First hour of each response as a UTC epoch.
+            interval: Step between hours in seconds.
+        """
+        n, _, hours = values.shape
+        if n == 0:
+            return
+        lats = np.array([lat for lat, _ in coords], dtype=np.float64)
+        lons = np.array([lon for _, lon in coords], dtype=np.float64)
+        epochs = (np.asarray(starts, dtype=np.int64)[:, None] + np.arange(hours) * interval).ravel()
+        table = pd.DataFrame({'lat': np.repeat(lats, hours), 'lon': np.repeat(lons, hours),
+                              'time': pd.to_datetime(epochs, unit='s', utc=True)})
+        for i, variable in enumerate(HOURLY_VARIABLES):
+            table[variable] = values[:, i, :].ravel()
+        table['tile'] = np.repeat([tile_id(lat, lon) for lat, lon in coords], hours)
+        # Padding from decode_batch is all-NaN
+        self._write_table(table[~np.isnan(values).all(axis=1).ravel()].copy())
+
+    def _write_table(self, table: pd.DataFrame) -> None:
+        table['month'] = table['time'].dt.strftime('%Y-%m')
+        table = table.astype({variable: 'float32' for variable in HOURLY_VARIABLES})
+        ds.write_dataset(
+            pa.Table.from_pandas(table, preserve_index=False), self.root, format='parquet',
+            partitioning=['tile', 'month'], partitioning_flavor='hive',
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+        )
+
+    def _dataset(self):
+        return ds.dataset(self.root, format='parquet', partitioning='hive')
+
+    def _scan(self, tiles, months, filter=None) -> pd.DataFrame:
+        if not self.root.exists():
+            return pd.DataFrame(columns=['lat', 'lon', 'time', *HOURLY_VARIABLES])
+        expr = ds.field('tile').isin(sorted(tiles)) & ds.field('month').isin(sorted(months))
+        if filter is not None:
+            expr = expr & filter
+        table = self._dataset().to_table(filter=expr, columns=['lat', 'lon', 'time', *HOURLY_VARIABLES])
+        frame = table.to_pandas()
+        # Refetched hours are appended rather than overwritten; archive values don't change, so keep one copy
+        return frame.drop_duplicates(subset=['lat', 'lon', 'time'], keep='last')
+
+    def query(self, lat: float, lon: float, start, end) -> pd.DataFrame:
+        """Return every cached hour for (lat, lon) with start <= time <= end (UTC), sorted by time."""
+        start, end = _utc(start), _utc(end)
+        months = pd.period_range(start.tz_localize(None), end.tz_localize(None), freq='M').strftime('%Y-%m')
+        frame = self._scan([tile_id(lat, lon)], months,
+                           (ds.field('lat') == float(lat)) & (ds.field('lon') == float(lon)))
+        frame = frame[(frame['time'] >= start) & (frame['time'] <= end)]
+        return frame.sort_values('time').reset_index(drop=True)
+
+    def window(self, lat: float, lon: float, timestamp, hours_before: int = 24, hours_after: int = 0) -> pd.DataFrame:
+        """Return the hours around a timestamp, e.g. the prior 24 h for a pressure trend."""
+        timestamp = _utc(timestamp).floor('h')
+        return self.query(lat, lon, timestamp - pd.Timedelta(hours=hours_before),
+                          timestamp + pd.Timedelta(hours=hours_after))
+
+    def at(self, points: pd.DataFrame, offsets=(0,)) -> pd.DataFrame:
+        """
+        Look up hourly values for many (lat, lon, timestamp) points in one pass.
+
+        Args:
+            points: DataFrame with lat, lon and a timezone-aware timestamp column.
+            offsets: Hour offsets relative to each timestamp (floored to the hour).
+
+        Returns:
+            One row per point and offset with the point's index in ``point``,
+            the ``offset`` and the weather columns (NaN where not cached).
+        """
+        hours = points['timestamp'].dt.tz_convert('UTC').dt.floor('h')
+        wanted = pd.concat([
+            pd.DataFrame({'point': points.index, 'offset': offset, 'lat': points['lat'].to_numpy(),
+                          'lon': points['lon'].to_numpy(), 'time': hours + pd.Timedelta(hours=offset)})
+            for offset in offsets
+        ], ignore_index=True)
+        tiles = {tile_id(lat, lon) for lat, lon in zip(wanted['lat'], wanted['lon'])}
+        months = set(wanted['time'].dt.strftime('%Y-%m'))
+        cached = self._scan(tiles, months)
+        cached['time'] = cached['time'].astype(wanted['time'].dtype)
+        return wanted.merge(cached, on=['lat', 'lon', 'time'], how='left')
+
+    def missing(self, keys) -> list:
+        """
+        Return the (lat, lon, date_str) keys whose local day isn't fully stored, in input order.
+
+        A day counts as stored when every hour from local midnight to the next
+        one is present (23 or 25 on DST-change days), which is what a fetch of
+        that date writes.
+        """
+        keys = [(float(lat), float(lon), date_str) for lat, lon, date_str in keys]
+        if not keys or not self.root.exists():
+            return keys
+        frame = pd.DataFrame(keys, columns=['lat', 'lon', 'date_str'])
+        days = pd.to_datetime(frame['date_str'], format='%Y-%m-%d')
+        starts = days.dt.tz_localize(TIMEZONE, ambiguous='NaT', nonexistent='shift_forward').dt.tz_convert('UTC')
+        ends = (days + pd.Timedelta(days=1)).dt.tz_localize(TIMEZONE, ambiguous='NaT',
+                                                              nonexistent='shift_forward').dt.tz_convert('UTC')
+        expected = ((ends - starts) / pd.Timedelta(hours=1)).fillna(24).to_numpy()
+        tiles = {tile_id(lat, lon) for lat, lon, _ in keys}
+        months = set(starts.dt.strftime('%Y-%m').dropna()) | set((ends - pd.Timedelta(hours=1)).dt.strftime('%Y-%m').dropna())
+        cached = self._scan(tiles, months)
+        if cached.empty:
+            return keys
+        cached['date_str'] = pd.to_datetime(cached['time'], utc=True).dt.tz_convert(TIMEZONE).dt.strftime('%Y-%m-%d')
+        # Stored hours with any value; all-NaN padding was never written
+        counts = cached.groupby(['lat', 'lon', 'date_str']).size()
+        stored = counts.reindex(pd.MultiIndex.from_frame(frame)).fillna(0).to_numpy()
+        return [key for key, have, need in zip(keys, stored, expected) if have < need]
+
+    def compact(self) -> None:
+        # Rewrite each partition as a single deduplicated file
+        for partition in sorted(self.root.glob('tile=*/month=*')):
+            files = sorted(partition.glob('*.parquet'))
+            if len(files) < 2:
+                continue
+            frame = ds.dataset(files, format='parquet').to_table().to_pandas()
+            frame = frame.drop_duplicates(subset=['lat', 'lon', 'time'], keep='last').sort_values(['lat', 'lon', 'time'])
+            target = partition / f"part-{uuid.uuid4().hex}-0.parquet"
+            frame.to_parquet(target, index=False)
+            for file in files:
+                file.unlink()
@@ -1,151 +1,460 @@
-from open_meteo import fetch_weather_data
-from geoloc import get_coordinates
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from open_meteo import fetch_weather_arrays, plan_weather_requests, daily_values, request_weight
+from geoloc import get_coordinates, lookup_offline
+from scheduler import FetchScheduler, share_limits
+from cache_store import CacheStore, WEATHER_COLUMNS
+from grid import add_grid_cells, dedup_report
+import metrics
+from metrics import stage
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from multiprocessing import get_context
+import numpy as np
 import pandas as pd
 from pathlib import Path
-import time
-import pickle
-import os
-from tqdm import tqdm
 
-def get_lunker_data(file: Path) -> pd.DataFrame:
-    # Read the CSV, skipping the first row if it's a title
-    df = pd.read_csv(file, skiprows=1)
-    # Normalize column names: strip spaces and make lower case for consistency
-    df.columns = df.columns.str.strip().str.lower()
-    # Parse date
+# pyarrow-backed modules are imported where they're used, so runs that don't touch them start faster
+if TYPE_CHECKING:
+    from hourly_store import HourlyStore
+
+# Declared up front so every chunk gets the same dtypes instead of whatever that chunk's values infer to;
+# nullable Int64 keeps day/year integral when a row leaves them blank, and any other column is read as text
+LUNKER_DTYPES = {
+    'lake_name': str, 'date': str, 'month': str, 'angler': str,
+    'weight': 'float64', 'length': 'float64', 'day': 'Int64', 'year': 'Int64',
+}
+MONTH_NUMBERS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
+}
+
+@lru_cache(maxsize=None)
+def month_number(name) -> float:
+    # "March", "mar", "Mar." and "3" all map to 3; anything else is NaN
+    key = str(name).strip().lower().rstrip('.')
+    if key.isdigit():
+        return float(key) if 1 <= int(key) <= 12 else np.nan
+    for month, number in MONTH_NUMBERS.items():
+        if len(key) >= 3 and month.startswith(key):
+            return float(number)
+    return np.nan
+
+def catch_dates(df: pd.DataFrame):
+    """Parse the export's date column, or its month/day/year columns, to datetime64; None if it has neither."""
     if 'date' in df.columns:
-        df['date_str'] = pd.to_datetime(df['date'], format='%m/%d/%Y', errors='coerce').dt.strftime('%Y-%m-%d')
-    else:
-        # Fallback to month, day, year
-        month_map = {
-            'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
-            'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12
-        }
-        if all(col in df.columns for col in ['month', 'day', 'year']):
-            df['month_num'] = df['month'].str.lower().map(month_map)
-            df['date_str'] = df['year'].astype(str) + '-' + df['month_num'].astype(str).str.zfill(2) + '-' + df[
-                'day'].astype(str).str.zfill(2)
-            df = df.drop(columns=['month_num'])
-    return df
+        return pd.to_datetime(df['date'], format='%m/%d/%Y', errors='coerce')
+    if all(col in df.columns for col in ['month', 'day', 'year']):
+        # Month names repeat endlessly, so look up each distinct one once
+        # (a missing month has code -1, which picks the trailing NaN)
+        codes, names = pd.factorize(df['month'])
+        months = np.array([month_number(name) for name in names] + [np.nan])[codes]
+        year = df['year'].to_numpy(dtype='float64', na_value=np.nan)
+        day = df['day'].to_numpy(dtype='float64', na_value=np.nan)
+        return pd.to_datetime(pd.DataFrame({'year': year, 'month': months, 'day': day}, index=df.index),
+                              errors='coerce')
+    return None
+
+def format_dates(dates: pd.Series) -> pd.Series:
+    # strftime only the distinct dates, then broadcast; NaT stays NaN
+    codes, uniques = pd.factorize(dates)
+    formatted = pd.Categorical.from_codes(codes, uniques.strftime('%Y-%m-%d'))
+    return pd.Series(formatted, index=dates.index).astype(object)
+
+def read_lunker_chunks(file: Path, chunksize: int = 100_000):
+    """
+    Yield the export in chunks of chunksize rows, with normalized column names and date_str.
+
+    The first line of the export is a title and is skipped.
+    """
+    header = pd.read_csv(file, skiprows=1, nrows=0).columns
+    # Normalize column names: strip spaces and make lower case for consistency
+    names = header.str.strip().str.lower()
+    dtypes = {raw: LUNKER_DTYPES.get(name, str) for raw, name in zip(header, names)}
+    for df in pd.read_csv(file, skiprows=1, dtype=dtypes, chunksize=chunksize):
+        df.columns = names
+        dates = catch_dates(df)
+        if dates is not None:
+            df['date_str'] = format_dates(dates)
+        yield df
+
+@stage('get_lunker_data')
+def get_lunker_data(file: Path) -> pd.DataFrame:
+    # Whole export in one frame
+    return pd.concat(read_lunker_chunks(file), ignore_index=True)
 
+def progress(iterable, total: int):
+    # tqdm is only imported once there's something to show progress for
+    if not total:
+        return iterable
+    from tqdm import tqdm
+    return tqdm(iterable, total=total)
+
+@stage('get_lat_long')
 def get_lat_long(cache: Path, df: pd.DataFrame) -> pd.DataFrame:
-    unique_locations = df[['lake_name']].drop_duplicates().reset_index(drop=True)
-    unique_locations['lat'] = None
-    unique_locations['lon'] = None
-    # Load existing geocode_dict if cache exists
-    if os.path.exists(cache):
-        with open(cache, 'rb') as f:
-            geocode_dict = pickle.load(f)
-        print(f"Loaded geocode cache with {len(geocode_dict)} entries")
-    else:
-        geocode_dict = {}
-    # Counter for saving every few iterations
-    save_interval = 10  # Save every 10 fetches
-    fetch_count = 0
-    for idx, row in tqdm(unique_locations.iterrows(), total=len(unique_locations)):
-        lake_name = row['lake_name']
-        if lake_name in geocode_dict:
-            if geocode_dict[lake_name] is None:
-                geocode_dict[lake_name] = (None, None)
-            lat, lon = geocode_dict[lake_name]
-            unique_locations.at[idx, 'lat'] = lat
-            unique_locations.at[idx, 'lon'] = lon
-            continue
-        try:
-            lat, lon = get_coordinates(str(lake_name))
-            unique_locations.at[idx, 'lat'] = lat
-            unique_locations.at[idx, 'lon'] = lon
-            geocode_dict[lake_name] = (lat, lon)
-            fetch_count += 1
-            if fetch_count % save_interval == 0:
-                with open(cache, 'wb') as f:
-                    pickle.dump(geocode_dict, f)
-                print(f"Saved geocode cache after {fetch_count} fetches")
-        except Exception:
-            geocode_dict[lake_name] = (None, None)
+    lake_names = df['lake_name'].drop_duplicates().tolist()
+    # Only the lakes in this frame are looked up in the cache store
+    store = CacheStore(cache)
+    geocode_dict = store.get_geocodes(lake_names)
+    print(f"Found {len(geocode_dict)} of {len(lake_names)} lakes in geocode cache")
+    to_fetch = [lake_name for lake_name in lake_names if lake_name not in geocode_dict]
+    metrics.increment('cache_hits', len(geocode_dict), provider='nominatim')
+    metrics.increment('cache_misses', len(to_fetch), provider='nominatim')
+    # Resolve what we can from the local gazetteer; those never touch the network or the cache.
+    # Cached Nominatim failures (None, None) get a try too, they're the lakes it's most likely to rescue
+    failed = [lake_name for lake_name, (lat, lon) in geocode_dict.items() if lat is None or lon is None]
+    offline = {lake_name: lookup_offline(str(lake_name)) for lake_name in to_fetch + failed}
+    offline = {lake_name: coords for lake_name, coords in offline.items() if coords is not None}
+    geocode_dict.update(offline)
+    metrics.increment('gazetteer_hits', len(offline))
+    metrics.increment('gazetteer_misses', len(to_fetch) + len(failed) - len(offline))
+    to_fetch = [lake_name for lake_name in to_fetch if lake_name not in offline]
+    print(f"Resolved {len(offline)} lakes from gazetteer, {len(to_fetch)} left for Nominatim")
+    # Nominatim's 1 req/s limit is enforced by the scheduler's token bucket
+    scheduler = FetchScheduler('nominatim', max_in_flight=2)
+    results = scheduler.map(lambda lake_name: get_coordinates(str(lake_name)), to_fetch)
+    for lake_name, coords, error in progress(results, len(to_fetch)):
+        if error is not None:
+            # Cache the failure so the lake isn't retried every run
+            coords = (None, None)
+            metrics.increment('fetch_failures', provider='nominatim')
             print(f"Failed to geocode {lake_name}")
-        time.sleep(1)  # Respect geocoder rate limits
-    # Save final geocode cache
-    with open(cache, 'wb') as f:
-        pickle.dump(geocode_dict, f)
-
-    print("Saved final geocode cache")
+        store.put_geocode(lake_name, *coords)
+        geocode_dict[lake_name] = coords
+    unique_locations = pd.DataFrame(
+        [(lake_name, *geocode_dict[lake_name]) for lake_name in lake_names], columns=['lake_name', 'lat', 'lon']
+    ).astype({'lat': 'float64', 'lon': 'float64'})
     # Merge lat/long back to original df
-    return df.merge(unique_locations[['lake_name', 'lat', 'lon']], on=['lake_name'], how='left')
-
-def get_openmeteo_weather_data(cache: Path, df: pd.DataFrame) -> pd.DataFrame:
-    # Get unique weather needs (lat, lon, date_str)
-    unique_weather = df[['lat', 'lon', 'date_str']].drop_duplicates().dropna(subset=['lat', 'lon']).reset_index(drop=True)
-    # Load existing weather_dict if cache exists
-    if os.path.exists(cache):
-        with open(cache, 'rb') as f:
-            weather_dict = pickle.load(f)
-        print(f"Loaded existing cache with {len(weather_dict)} entries")
-    else:
-        weather_dict = {}
-    # Counter for saving every few iterations
-    save_interval = 10 # Save every 10 fetches
-    fetch_count = 0
-    for idx, row in tqdm(unique_weather.iterrows(), total=len(unique_weather)):
-        lat = row['lat']
-        lon = row['lon']
-        if lat is None or lon is None:
+    return df.merge(unique_locations, on=['lake_name'], how='left')
+
+def fetch_weather_daily(store: CacheStore, missing: list, hourly: HourlyStore = None) -> None:
+    # One request per (lat, lon, date)
+    scheduler = FetchScheduler('open-meteo')
+    results = scheduler.map(lambda key: fetch_weather_arrays([key[:2]], key[2], key[2]), missing,
+                            cost=lambda key: request_weight(key[2], key[2], 1))
+    for key, decoded, error in progress(results, len(missing)):
+        lat, lon, date = key
+        if error is not None:
+            metrics.increment('fetch_failures', provider='open-meteo')
+            print(f"Failed to fetch weather for {lat}, {lon} on {date}: {error}")
             continue
-        date = row['date_str']
-        key = (lat, lon, date)
-        if key in weather_dict:
+        values, starts, interval = decoded
+        if hourly is not None:
+            hourly.write_arrays([(lat, lon)], values, starts, interval)
+        # Noon is local hour 12, the same row the batched path picks, so both store the same value for a key
+        noon = dict(zip(*daily_values(values[0], starts[0], interval)))
+        if date in noon:
+            store.put_weather(key, dict(zip(WEATHER_COLUMNS, noon[date])))
+        else:
+            metrics.increment('fetch_failures', provider='open-meteo')
+            print(f"Insufficient data for {lat}, {lon} on {date}")
+
+def fetch_weather_plan(store: CacheStore, plan: list, needed: set, hourly: HourlyStore = None):
+    """
+    Run planned (start, end, coords) requests, caching the noon rows for keys in needed.
+
+    Yields each request and its error (None on success) as it completes, so
+    callers can record progress; keys that were stored are removed from needed.
+    """
+    scheduler = FetchScheduler('open-meteo')
+    # Decoded straight into (locations, variables, hours) arrays; no per-location DataFrames
+    # Each request takes as many tokens as the weighted calls Open-Meteo bills it for
+    results = scheduler.map(lambda request: fetch_weather_arrays(request[2], request[0], request[1]), plan,
+                            cost=lambda request: request_weight(request[0], request[1], len(request[2])))
+    for request, decoded, error in results:
+        start, end, coords = request
+        if error is not None:
+            metrics.increment('fetch_failures', provider='open-meteo')
+            print(f"Failed to fetch weather for {len(coords)} locations from {start} to {end}: {error}")
+            yield request, error
             continue
-        try:
-            hourly_df = fetch_weather_data(lat, lon, date)
-            # Simply select the 12th row (0-based index 11 for 11:00 UTC or 12 for 12:00; assuming 12:00 UTC as noon approximation)
-            if len(hourly_df) >= 13:
-                noon_row = hourly_df.iloc[12] # 12:00 UTC
-                weather_data = {
-                    'noon_temperature_2m': noon_row['temperature_2m'],
-                    'noon_cloud_cover': noon_row['cloud_cover'],
-                    'noon_rain': noon_row['rain'],
-                    'noon_snowfall': noon_row['snowfall'],
-                    'noon_surface_pressure': noon_row['surface_pressure'],
-                    'noon_pressure_msl': noon_row['pressure_msl'],
-                    'noon_wind_speed_10m': noon_row['wind_speed_10m']
-                }
-                weather_dict[key] = weather_data
-                fetch_count += 1
-                if fetch_count % save_interval == 0:
-                    with open(cache, 'wb') as f:
-                        pickle.dump(weather_dict, f)
-                    print(f"Saved cache after {fetch_count} fetches")
-            else:
-                print(f"Insufficient data for {lat}, {lon} on {date}")
-        except Exception as e:
-            print(f"Failed to fetch weather for {lat}, {lon} on {date}: {e}")
-        time.sleep(0.1)
-    # Save final cache
-    with open(cache, 'wb') as f:
-        pickle.dump(weather_dict, f)
-    print("Saved final cache")
-    # Add weather columns to df
-    weather_columns = ['noon_temperature_2m', 'noon_cloud_cover', 'noon_rain', 'noon_snowfall',
-                       'noon_surface_pressure', 'noon_pressure_msl', 'noon_wind_speed_10m']
-    for col in weather_columns:
-        df[col] = None
-    for idx, row in df.iterrows():
-        if pd.notna(row['lat']) and pd.notna(row['lon']) and pd.notna(row['date_str']):
-            key = (row['lat'], row['lon'], row['date_str'])
-            if key in weather_dict:
-                for col in weather_columns:
-                    df.at[idx, col] = weather_dict[key][col]
+        values, starts, interval = decoded
+        if hourly is not None:
+            # Keep all 24 hours of every fetched day, not just the noon row
+            hourly.write_arrays(coords, values, starts, interval)
+        for (lat, lon), series, series_start in zip(coords, values, starts):
+            for date_str, noon_values in zip(*daily_values(series, series_start, interval)):
+                key = (lat, lon, date_str)
+                if key in needed:
+                    store.put_weather(key, dict(zip(WEATHER_COLUMNS, noon_values)))
+                    needed.discard(key)
+        yield request, None
+
+def fetch_weather_batched(store: CacheStore, missing: list, max_locations: int = 50, hourly: HourlyStore = None) -> None:
+    # One multi-location request per planned (start, end) window, sliced back into per-day rows
+    needed = set(missing)
+    plan = plan_weather_requests(missing, max_locations=max_locations)
+    print(f"Planned {len(plan)} requests for {len(missing)} missing (lat, lon, date) keys")
+    for _ in progress(fetch_weather_plan(store, plan, needed, hourly), len(plan)):
+        pass
+    metrics.increment('fetch_failures', len(needed), provider='open-meteo')
+    for lat, lon, date in needed:
+        print(f"Insufficient data for {lat}, {lon} on {date}")
+
+@stage('get_openmeteo_weather_data')
+def get_openmeteo_weather_data(cache: Path, df: pd.DataFrame, batch: bool = True, hourly_dir: Path = None,
+                               features: bool = False, compact: bool = True) -> pd.DataFrame:
+    # Weather is fetched and cached per grid cell, so nearby lakes share one key
+    if features and not hourly_dir:
+        raise ValueError("Weather features are computed from the hourly store; pass hourly_dir")
+    if features:
+        from features import daily_aggregates, get_weather_features, lookback_keys
+    df = add_grid_cells(df)
+    dedup_report(df)
+    # Get unique weather needs (cell_lat, cell_lon, date_str)
+    unique_weather = df[['cell_lat', 'cell_lon', 'date_str']].drop_duplicates().dropna().reset_index(drop=True)
+    keys = list(unique_weather.itertuples(index=False, name=None))
+    store = CacheStore(cache)
+    # Feature windows also need the days before each catch
+    fetch_keys = lookback_keys(keys) if features else keys
+    missing = store.missing_weather(fetch_keys)
+    print(f"Found {len(fetch_keys) - len(missing)} of {len(fetch_keys)} (cell, date) keys in weather cache")
+    metrics.increment('cache_hits', len(fetch_keys) - len(missing), provider='open-meteo')
+    metrics.increment('cache_misses', len(missing), provider='open-meteo')
+    # Only a run with something to fetch or features to compute needs the hourly store (and pyarrow)
+    hourly = None
+    if hourly_dir and (missing or features):
+        from hourly_store import HourlyStore
+        hourly = HourlyStore(hourly_dir)
+    if features:
+        # Features read the hourly store, which can lack days the noon cache has
+        # (migrated caches, rows cached before it existed, a deleted hourly/), so fetch those too
+        gaps = set(hourly.missing(fetch_keys))
+        missing = [key for key in missing if key not in gaps] + sorted(gaps)
+        print(f"Hourly store is missing {len(gaps)} of {len(fetch_keys)} (cell, date) keys needed for features")
+    if batch:
+        fetch_weather_batched(store, missing, hourly=hourly)
+    else:
+        fetch_weather_daily(store, missing, hourly=hourly)
+    if hourly is not None and missing and compact:
+        # Every request wrote a file per (tile, month); fold them together before anything scans the store
+        hourly.compact()
+    if features:
+        df = get_weather_features(df, daily_aggregates(hourly_dir))
+    weather = store.weather_frame(keys).rename(columns={'lat': 'cell_lat', 'lon': 'cell_lon'})
+    return join_weather(df, weather, on=['cell_lat', 'cell_lon', 'date_str'])
+
+def join_weather(df: pd.DataFrame, weather: pd.DataFrame, on=('lat', 'lon', 'date_str')) -> pd.DataFrame:
+    # One keyed join instead of per-row lookups; rows without weather get NaN
+    df = df.drop(columns=WEATHER_COLUMNS, errors='ignore')
+    df = df.merge(weather, on=list(on), how='left')
     # Drop temporary date_str if not needed
     return df.drop(columns=['date_str'], errors='ignore')
 
+def raw_columns(df: pd.DataFrame) -> list:
+    # The export's own columns, as opposed to ones the pipeline adds
+    return sorted(col for col in df.columns if col not in ('date_str', 'row_fingerprint'))
+
+def fingerprint_rows(df: pd.DataFrame) -> pd.Series:
+    """
+    Hash of the raw export columns, stable across runs and independent of row order.
+
+    Hashes a canonical text form rather than the typed values, so the
+    fingerprint doesn't depend on the dtypes pandas picked for this file or
+    chunk: numbers compare as floats (13 == 13.0) and every missing value is ''.
+    """
+    raw = df[raw_columns(df)]
+    numeric = raw.select_dtypes('number').columns
+    text = raw.astype({col: 'float64' for col in numeric}).astype(str).where(raw.notna(), '')
+    return pd.util.hash_pandas_object(text, index=False).rename('row_fingerprint')
+
+def enrich(df: pd.DataFrame, cache_path: Path, hourly_dir: Path = None, asos_dir: Path = None,
+           workers: int = 1, features: bool = False, pool: ProcessPoolExecutor = None) -> pd.DataFrame:
+    df = get_lat_long(cache_path, df)
+    if workers > 1:
+        return enrich_parallel(df, cache_path, hourly_dir, asos_dir, workers, features=features, pool=pool)
+    return enrich_located(df, cache_path, hourly_dir, asos_dir, features)
+
+def enrich_located(df: pd.DataFrame, cache_path: Path, hourly_dir: Path = None, asos_dir: Path = None,
+                   features: bool = False, compact: bool = True) -> pd.DataFrame:
+    # Stages that run after geocoding; also the unit of work for each worker process
+    # ASOS observations are only joined once asos_request.py/asos_process.py have been run
+    if asos_dir is not None and (asos_dir / 'stations.parquet').exists():
+        from asos_enrich import get_asos_observations
+        df = get_asos_observations(df, asos_dir / 'stations.parquet', asos_dir / 'observations')
+    return get_openmeteo_weather_data(cache_path, df, hourly_dir=hourly_dir, features=features, compact=compact)
+
+def init_worker(workers: int, metrics_config: dict) -> None:
+    # Every worker has its own token buckets, so split the provider quotas between them
+    share_limits(workers)
+    metrics.configure(metrics_config['log_path'], metrics_config['profile'], Path(metrics_config['profile_dir']))
+
+def enrich_partition(df: pd.DataFrame, cache_path: Path, hourly_dir: Path = None, asos_dir: Path = None,
+                     features: bool = False):
+    # Ship this task's metrics back with its rows; the worker's registry is reset so nothing is counted twice
+    metrics.registry.reset()
+    # Workers may share hourly store partitions, so only the parent compacts them
+    df = enrich_located(df, cache_path, hourly_dir, asos_dir, features, compact=False)
+    return df, metrics.registry.snapshot()
+
+def worker_pool(workers: int):
+    # Spawned workers re-import pandas and pyarrow, so a run creates its pool once and every chunk reuses it
+    if workers <= 1:
+        return nullcontext()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                               initializer=init_worker, initargs=(workers, metrics.config()))
+
+def enrich_parallel(df: pd.DataFrame, cache_path: Path, hourly_dir: Path = None, asos_dir: Path = None,
+                    workers: int = 2, partitions_per_worker: int = 4, features: bool = False,
+                    pool: ProcessPoolExecutor = None) -> pd.DataFrame:
+    """
+    Run the post-geocoding stages on a process pool, one partition of grid cells per task.
+
+    Rows sharing a grid cell (or, without coordinates, a lake) land in the same
+    partition so their weather is fetched once. Workers are spawned fresh, so
+    each builds its own HTTP sessions, and they share the on-disk caches.
+    Results are reassembled in input order. Pass a worker_pool(workers) as
+    pool to reuse it across calls; otherwise one is created for this call.
+    """
+    if pool is None:
+        with worker_pool(workers) as pool:
+            return enrich_parallel(df, cache_path, hourly_dir, asos_dir, workers, partitions_per_worker, features,
+                                   pool)
+    df = df.reset_index(drop=True)
+    df['_row'] = np.arange(len(df))
+    key = add_grid_cells(df)['cell_id'].fillna(df['lake_name'].astype(str))
+    n_partitions = workers * partitions_per_worker
+    partition = pd.util.hash_array(key.to_numpy(dtype=object)) % n_partitions
+    parts = [part for _, part in df.groupby(partition, sort=True)]
+    print(f"Enriching {len(df)} rows in {len(parts)} partitions on {workers} workers")
+    task = partial(enrich_partition, cache_path=cache_path, hourly_dir=hourly_dir, asos_dir=asos_dir,
+                   features=features)
+    results = []
+    for part, snapshot in pool.map(task, parts):
+        metrics.registry.merge(snapshot)
+        results.append(part)
+    if hourly_dir and Path(hourly_dir).exists():
+        from hourly_store import HourlyStore
+        HourlyStore(hourly_dir).compact()
+    return pd.concat(results, ignore_index=True).sort_values('_row').drop(columns='_row').reset_index(drop=True)
+
+def completed_fingerprints(output_dir: Path, columns: list) -> pd.Series:
+    # Recomputed from the stored raw columns, so parts written under an older fingerprint still match
+    parts = sorted(output_dir.glob('part-*.parquet')) if output_dir.exists() else []
+    if not parts:
+        return pd.Series([], dtype='uint64')
+    return pd.concat([fingerprint_rows(pd.read_parquet(part, columns=columns)) for part in parts], ignore_index=True)
+
+def write_parquet(df: pd.DataFrame, path: Path) -> None:
+    # Write then rename so readers never see a partial file
+    df.to_parquet(path.with_suffix('.tmp'), index=False)
+    path.with_suffix('.tmp').replace(path)
+
+def run_incremental(file_path: Path, output_dir: Path, cache_path: Path, hourly_dir: Path = None,
+                    asos_dir: Path = None, workers: int = 1, chunksize: int = None, features: bool = False) -> int:
+    """
+    Enrich only the rows of file_path that are not in output_dir yet.
+
+    output_dir is a Parquet dataset with one part file per run (or per chunk
+    with chunksize); rows are matched on a fingerprint of their raw export
+    columns, so a nightly refresh only pays for the rows it adds.
+
+    Rows that came out without any weather (failed geocode or fetch) go to
+    output_dir/pending.parquet instead of a part file. That file is rewritten
+    as the run goes, so it and the part files always hold each row once, and
+    pending rows are enriched again by every run until they succeed.
+
+    Returns:
+        Number of rows appended to part files.
+    """
+    pending_path = output_dir / 'pending.parquet'
+    # Last run's pending rows that this run hasn't reached yet
+    still_pending = pd.read_parquet(pending_path) if pending_path.exists() else pd.DataFrame()
+    failed = []
+    done = None
+    chunks = read_lunker_chunks(file_path, chunksize) if chunksize else [get_lunker_data(file_path)]
+    appended = 0
+    with worker_pool(workers) as pool:
+        for df in chunks:
+            if done is None:
+                done = completed_fingerprints(output_dir, raw_columns(df))
+            df['row_fingerprint'] = fingerprint_rows(df)
+            new_rows = df[~df['row_fingerprint'].isin(done)].reset_index(drop=True)
+            print(f"{len(new_rows)} of {len(df)} rows are new or pending since the last run")
+            if new_rows.empty:
+                continue
+            new_rows = enrich(new_rows, cache_path, hourly_dir, asos_dir, workers, features, pool)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            missing_weather = new_rows[WEATHER_COLUMNS].isna().all(axis=1)
+            complete = new_rows[~missing_weather]
+            if not complete.empty:
+                part = output_dir / f"part-{pd.Timestamp.now(tz='UTC'):%Y%m%dT%H%M%S%f}.parquet"
+                write_parquet(complete, part)
+                print(f"Appended {len(complete)} rows to {part}")
+                appended += len(complete)
+            failed.append(new_rows[missing_weather])
+            if not still_pending.empty:
+                still_pending = still_pending[~still_pending['row_fingerprint'].isin(df['row_fingerprint'])]
+            pending = pd.concat([still_pending, *failed], ignore_index=True)
+            if not pending.empty:
+                write_parquet(pending, pending_path)
+            elif pending_path.exists():
+                pending_path.unlink()
+            print(f"{len(pending)} rows without weather are pending a retry")
+    return appended
+
+def run_streaming(file_path: Path, output_path: Path, cache_path: Path, hourly_dir: Path = None,
+                  asos_dir: Path = None, workers: int = 1, chunksize: int = 100_000, features: bool = False) -> int:
+    """
+    Enrich the export chunk by chunk, appending each chunk to output_path as it's done.
+
+    Only one chunk is in memory at a time, so peak memory depends on chunksize,
+    not on the size of the export. Returns the number of rows written.
+    """
+    tmp = Path(f"{output_path}.tmp")
+    written = 0
+    with worker_pool(workers) as pool:
+        for df in read_lunker_chunks(file_path, chunksize):
+            df = enrich(df, cache_path, hourly_dir, asos_dir, workers, features, pool)
+            df.to_csv(tmp, mode='a' if written else 'w', header=not written, index=False)
+            written += len(df)
+            print(f"Enriched {written} rows")
+    # Rename once complete so a killed run never leaves a truncated output
+    if written:
+        tmp.rename(output_path)
+    return written
 
 
 if __name__ == "__main__":
-    file_path = Path("./sharelunker_raw_data_2025-07-13_2143.csv")
-    df = get_lunker_data(file_path)
-    df = get_lat_long(file_path.parent / 'geocode_cache.pkl', df)
-    df = get_openmeteo_weather_data(file_path.parent / 'weather_cache.pkl', df)
-    # Save the updated data
-    output_path = file_path.parent / 'sharelunker_with_weather_test.csv'
-    df.to_csv(output_path, index=False)
-    print(f"Data saved to {output_path}")
+    parser = argparse.ArgumentParser(description="Add weather conditions to a ShareLunker export")
+    parser.add_argument('--input', type=Path, default=Path("./sharelunker_raw_data_2025-07-13_2143.csv"))
+    parser.add_argument('--incremental', action='store_true',
+                        help="only enrich rows not already in the Parquet output directory")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes for the enrichment stages after geocoding")
+    parser.add_argument('--metrics-log', type=Path,
+                        help="append structured JSON span/metric events to this file ('-' for stderr)")
+    parser.add_argument('--prometheus', type=Path, help="write a Prometheus textfile with counters and histograms")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help="profile each stage")
+    parser.add_argument('--chunksize', type=int,
+                        help="read, enrich and write the export this many rows at a time to keep memory flat")
+    parser.add_argument('--features', action='store_true',
+                        help="add pressure trend, 24/48/72 h weather window and sun/moon columns")
+    args = parser.parse_args()
+    metrics.configure(args.metrics_log, args.profile)
+    file_path = args.input
+    cache_path = file_path.parent / 'lunker_cache.sqlite'
+    hourly_dir = file_path.parent / 'hourly'
+    asos_dir = file_path.parent / 'asos'
+    if args.incremental:
+        run_incremental(file_path, file_path.parent / 'sharelunker_with_weather', cache_path, hourly_dir, asos_dir,
+                        args.workers, args.chunksize, args.features)
+    elif args.chunksize:
+        output_path = file_path.parent / 'sharelunker_with_weather_test.csv'
+        run_streaming(file_path, output_path, cache_path, hourly_dir, asos_dir, args.workers, args.chunksize,
+                      args.features)
+        print(f"Data saved to {output_path}")
+    else:
+        df = get_lunker_data(file_path)
+        df = enrich(df, cache_path, hourly_dir, asos_dir, args.workers, args.features)
+        # Save the updated data
+        output_path = file_path.parent / 'sharelunker_with_weather_test.csv'
+        df.to_csv(output_path, index=False)
+        print(f"Data saved to {output_path}")
+    metrics.event('summary', **metrics.registry.snapshot())
+    if args.prometheus:
+        metrics.write_prometheus(args.prometheus)
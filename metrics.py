@@ -0,0 +1,194 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds in seconds for span and HTTP latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+logger = logging.getLogger('lunker.metrics')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    """Process-wide counters and latency histograms, keyed by name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            buckets, total, count = self.histograms.get(key, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+            buckets = [n + (value <= bound) for n, bound in zip(buckets, LATENCY_BUCKETS)]
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def snapshot(self) -> dict:
+        # JSON-friendly copy, also used to ship worker-process metrics back to the parent
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), buckets, total, count]
+                               for (name, labels), (buckets, total, count) in self.histograms.items()],
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        for name, labels, value in snapshot['counters']:
+            self.increment(name, value, **labels)
+        with self.lock:
+            for name, labels, buckets, total, count in snapshot['histograms']:
+                key = _key(name, labels)
+                old_buckets, old_total, old_count = self.histograms.get(key, ([0] * len(LATENCY_BUCKETS), 0.0, 0))
+                self.histograms[key] = ([a + b for a, b in zip(old_buckets, buckets)], old_total + total,
+                                        old_count + count)
+
+    def prometheus_text(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE lunker_{name}_total counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"lunker_{name}_total{fmt(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE lunker_{name} histogram")
+                for (n, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, cumulative in zip(LATENCY_BUCKETS, buckets):
+                        lines.append(f"lunker_{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"lunker_{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"lunker_{name}_sum{fmt(labels)} {total}")
+                    lines.append(f"lunker_{name}_count{fmt(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+increment = registry.increment
+observe = registry.observe
+
+_config = {'log_path': None, 'profile': None, 'profile_dir': 'profiles'}
+# Only the outermost stage is profiled; profilers can't nest
+_profiling = threading.local()
+
+
+def configure(log_path: Path = None, profile: str = None, profile_dir: Path = Path('profiles')) -> None:
+    """
+    Turn on structured JSON logs and/or per-stage profiling for this process.
+
+    Args:
+        log_path: File to append one JSON object per line to; '-' logs to stderr.
+        profile: 'cprofile' or 'pyinstrument' to profile every stage.
+        profile_dir: Where stage profiles are written.
+    """
+    _config.update(log_path=str(log_path) if log_path else None, profile=profile, profile_dir=str(profile_dir))
+    logger.handlers.clear()
+    if log_path:
+        handler = logging.StreamHandler() if str(log_path) == '-' else logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+
+
+def config() -> dict:
+    # Passed to worker processes so they log and profile the same way
+    return dict(_config)
+
+
+def event(event_type: str, **fields) -> None:
+    if logger.handlers:
+        logger.info(json.dumps({'ts': time.time(), 'pid': os.getpid(), 'event': event_type, **fields}, default=str))
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block, record it in the span_seconds histogram and emit a JSON span event."""
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('span_seconds', elapsed, span=name, **labels)
+        event('span', span=name, seconds=round(elapsed, 6), status=status, **labels)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    span() for a pipeline stage, optionally under a profiler.
+
+    Works as a decorator too, e.g. @stage('get_lat_long').
+    """
+    profiler = _start_profiler()
+    try:
+        with span(name, kind='stage'):
+            yield
+    finally:
+        if profiler is not None:
+            _stop_profiler(profiler, name)
+
+
+def _start_profiler():
+    if getattr(_profiling, 'active', False):
+        return None
+    if _config['profile'] == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        _profiling.active = True
+        return profiler
+    if _config['profile'] == 'pyinstrument':
+        # Optional dependency, only needed when asked for
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        _profiling.active = True
+        return profiler
+    return None
+
+
+def _stop_profiler(profiler, name: str) -> None:
+    _profiling.active = False
+    os.makedirs(_config['profile_dir'], exist_ok=True)
+    path = Path(_config['profile_dir']) / f"{name}-{os.getpid()}-{int(time.time())}"
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(f"{path}.prof")
+    else:
+        profiler.stop()
+        Path(f"{path}.html").write_text(profiler.output_html())
+    event('profile', stage=name, path=str(path))
+
+
+def write_prometheus(path: Path) -> None:
+    # Node exporter textfile collector format; write then rename so scrapes never see a partial file
+    tmp = Path(f"{path}.tmp")
+    tmp.write_text(registry.prometheus_text())
+    os.replace(tmp, path)
@@ -1,61 +1,230 @@
-import openmeteo_requests
+import os
+import threading
+from collections import defaultdict
+from datetime import date as dt_date
 
+import numpy as np
 import pandas as pd
-import requests_cache
-from retry_requests import retry
 
-# example: https://open-meteo.com/en/docs/historical-weather-api?start_date=2025-08-09&end_date=2025-08-09&hourly=temperature_2m,cloud_cover,rain,snowfall,surface_pressure,pressure_msl,wind_speed_10m&temperature_unit=fahrenheit&wind_speed_unit=mph
-# Setup the Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
-retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-openmeteo = openmeteo_requests.Client(session = retry_session)
+import metrics
 
-def fetch_weather_data(lat: float, lon: float, date: str):
-    # Make sure all required weather variables are listed here
-    # The order of variables in hourly or daily is important to assign them correctly below
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    params = {
-    	"latitude": lat,
-    	"longitude": lon,
-    	"start_date": date,
-    	"end_date": date,
-    	"hourly": ["temperature_2m", "cloud_cover", "rain", "snowfall", "surface_pressure", "pressure_msl", "wind_speed_10m"],
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Open-Meteo API client with a response cache, built on first use.
+
+    openmeteo_requests and requests_cache are only imported here, so runs
+    that never miss the weather cache don't pay for them or open .cache.
+    """
+    global _client
+    # example: https://open-meteo.com/en/docs/historical-weather-api?start_date=2025-08-09&end_date=2025-08-09&hourly=temperature_2m,cloud_cover,rain,snowfall,surface_pressure,pressure_msl,wind_speed_10m&temperature_unit=fahrenheit&wind_speed_unit=mph
+    with _client_lock:
+        if _client is None:
+            import openmeteo_requests
+            import requests_cache
+
+            # No retrying session here: FetchScheduler retries, and every attempt has to go through its token bucket
+            cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
+            send = cache_session.send
+
+            def counted_send(request, **kwargs):
+                # Feed requests_cache hit/miss information into the shared metrics counters
+                response = send(request, **kwargs)
+                metrics.increment('http_cache', provider='open-meteo',
+                                  result='hit' if getattr(response, 'from_cache', False) else 'miss')
+                return response
+
+            cache_session.send = counted_send
+            _client = openmeteo_requests.Client(session = cache_session)
+        return _client
+
+
+# Overridable so benchmarks can point the client at a local stub server
+ARCHIVE_URL = os.environ.get('OPEN_METEO_ARCHIVE_URL', "https://archive-api.open-meteo.com/v1/archive")
+TIMEZONE = "America/Chicago"
+# The order of variables in hourly or daily is important to assign them correctly below
+HOURLY_VARIABLES = ["temperature_2m", "cloud_cover", "rain", "snowfall", "surface_pressure", "pressure_msl", "wind_speed_10m"]
+
+
+def decode_hourly(response) -> tuple[np.ndarray, int, int]:
+    """
+    Decode one response's hourly block without building any pandas objects.
+
+    Returns:
+        Tuple (values, start, interval): a float32 array of shape (variables, hours) in
+        HOURLY_VARIABLES order, the first hour as a UTC epoch and the step in seconds.
+    """
+    # The order of variables needs to be the same as requested.
+    hourly = response.Hourly()
+    hours = (hourly.TimeEnd() - hourly.Time()) // hourly.Interval()
+    values = np.empty((len(HOURLY_VARIABLES), hours), dtype=np.float32)
+    for i in range(len(HOURLY_VARIABLES)):
+        values[i] = hourly.Variables(i).ValuesAsNumpy()
+    return values, hourly.Time(), hourly.Interval()
+
+
+def decode_batch(responses) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Decode many responses into one preallocated array.
+
+    Returns:
+        Tuple (values, starts, interval): values has shape (responses, variables, hours), padded with
+        NaN where a response is shorter than the longest one; starts holds each response's first hour.
+    """
+    hourly_blocks = [response.Hourly() for response in responses]
+    hours = max(((h.TimeEnd() - h.Time()) // h.Interval() for h in hourly_blocks), default=0)
+    values = np.full((len(hourly_blocks), len(HOURLY_VARIABLES), hours), np.nan, dtype=np.float32)
+    starts = np.empty(len(hourly_blocks), dtype=np.int64)
+    for n, hourly in enumerate(hourly_blocks):
+        for i in range(len(HOURLY_VARIABLES)):
+            series = hourly.Variables(i).ValuesAsNumpy()
+            values[n, i, :len(series)] = series
+        starts[n] = hourly.Time()
+    interval = hourly_blocks[0].Interval() if hourly_blocks else 3600
+    return values, starts, interval
+
+
+def hourly_frame(values: np.ndarray, start: int, interval: int) -> pd.DataFrame:
+    # DataFrame form of one decoded (variables, hours) array
+    hourly_data = {"date": pd.date_range(
+    	start = pd.to_datetime(start, unit = "s", utc = True),
+    	periods = values.shape[1],
+    	freq = pd.Timedelta(seconds = interval),
+    )}
+    for i, variable in enumerate(HOURLY_VARIABLES):
+        hourly_data[variable] = values[i]
+    return pd.DataFrame(data = hourly_data)
+
+
+def _request_params(coords: list[tuple[float, float]], start_date: str, end_date: str) -> dict:
+    return {
+    	"latitude": [lat for lat, _ in coords],
+    	"longitude": [lon for _, lon in coords],
+    	"start_date": start_date,
+    	"end_date": end_date,
+    	"hourly": HOURLY_VARIABLES,
     	"temperature_unit": "fahrenheit",
     	"wind_speed_unit": "mph",
     	"precipitation_unit": "inch",
-        "timezone": "America/Chicago",
+        "timezone": TIMEZONE,
     }
-    responses = openmeteo.weather_api(url, params=params)
 
-    # Process first location. Add a for-loop for multiple locations or weather models
-    response = responses[0]
-    # Process hourly data. The order of variables needs to be the same as requested.
-    hourly = response.Hourly()
-    hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-    hourly_cloud_cover = hourly.Variables(1).ValuesAsNumpy()
-    hourly_rain = hourly.Variables(2).ValuesAsNumpy()
-    hourly_snowfall = hourly.Variables(3).ValuesAsNumpy()
-    hourly_surface_pressure = hourly.Variables(4).ValuesAsNumpy()
-    hourly_pressure_msl = hourly.Variables(5).ValuesAsNumpy()
-    hourly_wind_speed_10m = hourly.Variables(6).ValuesAsNumpy()
 
-    hourly_data = {"date": pd.date_range(
-    	start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-    	end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-    	freq = pd.Timedelta(seconds = hourly.Interval()),
-    	inclusive = "left"
-    )}
+def request_weight(start_date: str, end_date: str, locations: int) -> float:
+    # Open-Meteo bills each location, each 14 days and each 10 variables of a request as a separate call
+    days = (dt_date.fromisoformat(end_date) - dt_date.fromisoformat(start_date)).days + 1
+    return locations * max(1.0, days / 14) * max(1.0, len(HOURLY_VARIABLES) / 10)
+
+
+def fetch_weather_arrays(coords: list[tuple[float, float]], start_date: str, end_date: str) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Fetch hourly weather for several locations over one date range as a single NumPy array.
+
+    Args:
+        coords: List of (lat, lon) tuples.
+        start_date: First local date to fetch (YYYY-MM-DD).
+        end_date: Last local date to fetch, inclusive (YYYY-MM-DD).
+
+    Returns:
+        (values, starts, interval) as returned by decode_batch, in the same order as coords.
+    """
+    # The client returns one response per location, in request order
+    responses = get_client().weather_api(ARCHIVE_URL, params=_request_params(coords, start_date, end_date))
+    return decode_batch(responses)
+
+
+def fetch_weather_range(coords: list[tuple[float, float]], start_date: str, end_date: str) -> list[pd.DataFrame]:
+    """
+    Fetch hourly weather for several locations over one date range in a single request.
+
+    Args:
+        coords: List of (lat, lon) tuples.
+        start_date: First local date to fetch (YYYY-MM-DD).
+        end_date: Last local date to fetch, inclusive (YYYY-MM-DD).
+
+    Returns:
+        One hourly DataFrame per coordinate, in the same order as coords.
+    """
+    responses = get_client().weather_api(ARCHIVE_URL, params=_request_params(coords, start_date, end_date))
+    return [hourly_frame(*decode_hourly(response)) for response in responses]
+
+
+def fetch_weather_data(lat: float, lon: float, date: str):
+    return fetch_weather_range([(lat, lon)], date, date)[0]
+
+
+def coordinate_windows(days) -> list[tuple[dt_date, dt_date]]:
+    """
+    Cover one coordinate's dates with the (start, end) windows Open-Meteo bills least for.
+
+    Contiguous runs of dates are windows of their own; a run is only folded
+    into the previous window when the merged window's request_weight is no
+    more than fetching both separately (gaps inside one 14-day block are free).
+    """
+    windows = []
+    for day in sorted(set(days)):
+        if windows and (day - windows[-1][1]).days <= 1:
+            windows[-1] = (windows[-1][0], day)
+            continue
+        if windows:
+            start, end = windows[-1]
+            merged = request_weight(start.isoformat(), day.isoformat(), 1)
+            separate = (request_weight(start.isoformat(), end.isoformat(), 1)
+                        + request_weight(day.isoformat(), day.isoformat(), 1))
+            if merged <= separate:
+                windows[-1] = (start, day)
+                continue
+        windows.append((day, day))
+    return windows
+
+
+def plan_weather_requests(keys, max_locations: int = 50) -> list[tuple[str, str, list[tuple[float, float]]]]:
+    """
+    Group (lat, lon, date_str) keys into range requests that cost as few weighted calls as possible.
+
+    Open-Meteo bills every location of a request for the request's whole
+    window, so each coordinate gets its own windows (coordinate_windows) and
+    only coordinates with identical windows share a multi-location request.
+
+    Args:
+        keys: Iterable of (lat, lon, date_str) tuples.
+        max_locations: Maximum number of coordinates packed into one request.
+
+    Returns:
+        List of (start_date, end_date, coords) tuples.
+    """
+    coord_dates = defaultdict(list)
+    for lat, lon, date in keys:
+        coord_dates[(lat, lon)].append(dt_date.fromisoformat(date))
+
+    windows = defaultdict(list)
+    for coord, days in coord_dates.items():
+        for start, end in coordinate_windows(days):
+            windows[(start, end)].append(coord)
+
+    plan = []
+    for (start, end), coords in sorted(windows.items()):
+        coords = sorted(coords)
+        for i in range(0, len(coords), max_locations):
+            plan.append((start.isoformat(), end.isoformat(), coords[i:i + max_locations]))
+    return plan
+
 
-    hourly_data["temperature_2m"] = hourly_temperature_2m
-    hourly_data["cloud_cover"] = hourly_cloud_cover
-    hourly_data["rain"] = hourly_rain
-    hourly_data["snowfall"] = hourly_snowfall
-    hourly_data["surface_pressure"] = hourly_surface_pressure
-    hourly_data["pressure_msl"] = hourly_pressure_msl
-    hourly_data["wind_speed_10m"] = hourly_wind_speed_10m
+def daily_values(values: np.ndarray, start: int, interval: int, hour: int = 12) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Slice one decoded (variables, hours) array down to one value per local date, taken at the given local hour.
 
-    hourly_dataframe = pd.DataFrame(data = hourly_data)
-    return hourly_dataframe
+    Returns:
+        Tuple (date_strs, rows): local dates and a (days, variables) array of the values at that local hour.
+    """
+    local = pd.to_datetime(start + np.arange(values.shape[1]) * interval, unit='s', utc=True).tz_convert(TIMEZONE)
+    idx = np.flatnonzero(local.hour == hour)
+    date_strs = local[idx].strftime('%Y-%m-%d').to_numpy()
+    date_strs, first = np.unique(date_strs, return_index=True)
+    return date_strs, values[:, idx[first]].T
 
 
 # Example usage
@@ -69,4 +238,4 @@ if __name__ == "__main__":
         data = fetch_weather_data(lat, lon, date)
         print(data)
     except ValueError as e:
-        print(e)
\ No newline at end of file
+        print(e)
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from cache_store import CacheStore
+from geoloc import lookup_offline
+from grid import snap
+from main import fetch_weather_plan, get_lat_long, read_lunker_chunks
+from open_meteo import plan_weather_requests, request_weight
+from scheduler import provider_limits
+
+# Seconds between plan file saves while prefetching; it is always saved on exit
+SAVE_INTERVAL = 10
+
+
+def catch_keys(file: Path, chunksize: int = 100_000) -> set:
+    # Distinct (lake_name, date_str) pairs in the export
+    keys = set()
+    for df in read_lunker_chunks(file, chunksize):
+        keys.update(df[['lake_name', 'date_str']].dropna().itertuples(index=False, name=None))
+    return keys
+
+
+def estimate_seconds(provider: str, calls: float) -> float:
+    # Time for the provider's slowest token bucket (per-second limit or daily quota) to let `calls` through
+    return max(max(0.0, calls - burst) / rate for rate, burst in provider_limits(provider))
+
+
+def weather_task(start: str, end: str, coords) -> dict:
+    group_id = hashlib.sha1(json.dumps(coords).encode()).hexdigest()[:10]
+    return {'id': f"{start}_{end}_{group_id}", 'start': start, 'end': end, 'coords': coords}
+
+
+def plan_requests(file: Path, cache_path: Path, features: bool = False, max_locations: int = 50,
+                  lakes: set = None, hourly_dir: Path = None) -> dict:
+    """
+    Work out every request a run over file would still make.
+
+    Lakes are resolved from the geocode cache and the local gazetteer; the
+    rest are geocode tasks. Located lakes are snapped to grid cells and their
+    (cell, date) keys checked against the weather cache; the misses are
+    grouped into the same multi-location requests the pipeline would make.
+    Weather for lakes that still need geocoding can't be planned yet, so it
+    is only estimated, as one uncached cell per lake; run() plans it once
+    they're resolved, planning only those lakes (`lakes`).
+    With features, days hourly_dir lacks are planned too, even when the
+    noon cache has them, since the features are computed from that store.
+    """
+    keys = catch_keys(file)
+    if lakes is not None:
+        keys = {key for key in keys if key[0] in lakes}
+    names = sorted({lake_name for lake_name, _ in keys})
+    store = CacheStore(cache_path)
+    geocodes = store.get_geocodes(names)
+    coords = {}
+    to_geocode = []
+    for lake_name in names:
+        found = geocodes.get(lake_name)
+        # Lakes Nominatim failed on are cached as (None, None); the gazetteer may still know them
+        if found is None or None in found:
+            found = lookup_offline(str(lake_name)) or found
+        if found is None:
+            to_geocode.append(lake_name)
+        else:
+            coords[lake_name] = found
+    cells = {}
+    for lake_name, (lat, lon) in coords.items():
+        # Failed geocodes are cached as (None, None)
+        if lat is not None and lon is not None:
+            cell_lat, cell_lon, _ = snap(lat, lon)
+            cells[lake_name] = (float(cell_lat), float(cell_lon))
+    weather_keys = sorted({(*cells[lake_name], date_str) for lake_name, date_str in keys if lake_name in cells})
+    # Lakes still to geocode are estimated as a cell each, an upper bound until run() locates them
+    placeholder = {lake_name: float(i) for i, lake_name in enumerate(to_geocode)}
+    unlocated_keys = sorted({(placeholder[lake_name], 0.0, date_str) for lake_name, date_str in keys
+                             if lake_name in placeholder})
+    if features:
+        from features import lookback_keys
+        weather_keys = lookback_keys(weather_keys)
+        unlocated_keys = lookback_keys(unlocated_keys)
+    missing = store.missing_weather(weather_keys)
+    if features and hourly_dir:
+        from hourly_store import HourlyStore
+        gaps = set(HourlyStore(hourly_dir).missing(weather_keys))
+        missing = [key for key in missing if key not in gaps] + sorted(gaps)
+    tasks = [weather_task(start, end, [list(coord) for coord in group])
+             for start, end, group in plan_weather_requests(missing, max_locations=max_locations)]
+    plan = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'input': str(file),
+        'cache': str(cache_path),
+        'features': features,
+        'max_locations': max_locations,
+        'geocode': to_geocode,
+        'weather': tasks,
+        'weather_keys': [list(key) for key in missing],
+        'unlocated': unlocated_estimate(to_geocode, unlocated_keys, max_locations),
+        'completed': {'geocode': [], 'weather': []},
+    }
+    plan['estimate'] = estimate(plan)
+    return plan
+
+
+def unlocated_estimate(lakes: list, keys: list, max_locations: int) -> dict:
+    # Weather for lakes that aren't geocoded yet, counting each lake as its own uncached cell
+    requests = plan_weather_requests(keys, max_locations=max_locations)
+    return {'lakes': len(lakes), 'keys': len(keys), 'requests': len(requests),
+            'calls': round(sum(request_weight(start, end, len(coords)) for start, end, coords in requests), 1)}
+
+
+def estimate(plan: dict) -> dict:
+    """Remaining calls and seconds per provider, under the scheduler's rate limits."""
+    geocode = [name for name in plan['geocode'] if name not in set(plan['completed']['geocode'])]
+    done = set(plan['completed']['weather'])
+    weather = [task for task in plan['weather'] if task['id'] not in done]
+    calls = sum(request_weight(task['start'], task['end'], len(task['coords'])) for task in weather)
+    unlocated = plan.get('unlocated') or {'lakes': 0, 'keys': 0, 'requests': 0, 'calls': 0.0}
+    return {
+        'nominatim': {'requests': len(geocode), 'seconds': estimate_seconds('nominatim', len(geocode))},
+        # The scheduler charges the open-meteo bucket per weighted call, so that's what bounds the runtime.
+        # Weather for lakes not geocoded yet is an upper bound and included in both numbers
+        'open-meteo': {'requests': len(weather) + unlocated['requests'],
+                       'calls': round(calls + unlocated['calls'], 1),
+                       'seconds': estimate_seconds('open-meteo', calls + unlocated['calls']),
+                       'unlocated': unlocated},
+    }
+
+
+def load_plan(path: Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_plan(plan: dict, path: Path) -> None:
+    # Write then rename so a killed prefetch never leaves a torn plan
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(plan, f, indent=1)
+    os.replace(tmp, path)
+
+
+def report(plan: dict) -> None:
+    for provider, numbers in plan['estimate'].items():
+        print(f"{provider}: {numbers['requests']} requests, ~{numbers['seconds'] / 60:.1f} min")
+        unlocated = numbers.get('unlocated')
+        if unlocated and unlocated['lakes']:
+            print(f"  includes at most {unlocated['requests']} requests ({unlocated['calls']} weighted calls) "
+                  f"for {unlocated['keys']} keys of {unlocated['lakes']} lakes that still need geocoding")
+
+
+def run(plan_path: Path, hourly_dir: Path = None, geocode_batch: int = 50) -> dict:
+    """
+    Prefetch everything in a plan file into the caches, resuming where a previous run stopped.
+
+    Completed tasks are recorded in the plan file as they finish; failed
+    ones stay pending and are retried by the next run.
+    """
+    plan = load_plan(plan_path)
+    cache_path = Path(plan['cache'])
+    geocoded = set(plan['completed']['geocode'])
+    pending = [name for name in plan['geocode'] if name not in geocoded]
+    for i in range(0, len(pending), geocode_batch):
+        batch = pending[i:i + geocode_batch]
+        # Same path as the pipeline, so results (and failures) land in the geocode cache
+        get_lat_long(cache_path, pd.DataFrame({'lake_name': batch}))
+        plan['completed']['geocode'].extend(batch)
+        save_plan(plan, plan_path)
+    if pending:
+        # Lakes located just now need weather too
+        replanned = plan_requests(Path(plan['input']), cache_path, plan['features'], plan['max_locations'],
+                                  lakes=set(pending), hourly_dir=hourly_dir)
+        known = {task['id'] for task in plan['weather']}
+        plan['weather'].extend(task for task in replanned['weather'] if task['id'] not in known)
+        plan['weather_keys'] = sorted({tuple(key) for key in plan['weather_keys'] + replanned['weather_keys']})
+        # Their weather is planned for real now; lakes Nominatim couldn't locate won't need any
+        plan['unlocated'] = None
+        save_plan(plan, plan_path)
+
+    done = set(plan['completed']['weather'])
+    tasks = {(task['start'], task['end'], tuple(map(tuple, task['coords']))): task['id']
+             for task in plan['weather'] if task['id'] not in done}
+    print(f"{len(done)} of {len(plan['weather'])} weather requests already prefetched")
+    store = CacheStore(cache_path)
+    needed = {tuple(key) for key in plan['weather_keys']}
+    hourly = None
+    if hourly_dir and tasks:
+        from hourly_store import HourlyStore
+        hourly = HourlyStore(hourly_dir)
+    saved = time.monotonic()
+    for request, error in fetch_weather_plan(store, [(start, end, list(coords)) for start, end, coords in tasks],
+                                             needed, hourly):
+        if error is None:
+            start, end, coords = request
+            plan['completed']['weather'].append(tasks[(start, end, tuple(coords))])
+        if time.monotonic() - saved > SAVE_INTERVAL:
+            save_plan(plan, plan_path)
+            saved = time.monotonic()
+    if hourly is not None:
+        # One file per (tile, month) partition rather than one per request
+        hourly.compact()
+    plan['estimate'] = estimate(plan)
+    save_plan(plan, plan_path)
+    report(plan)
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan and prefetch the network requests a run would make")
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan', help="write a plan file and print its call/runtime estimate")
+    plan_parser.add_argument('--input', type=Path, default=Path("./sharelunker_raw_data_2025-07-13_2143.csv"))
+    plan_parser.add_argument('--out', type=Path, default=Path('prefetch_plan.json'))
+    plan_parser.add_argument('--features', action='store_true', help="also plan the lookback days --features needs")
+    plan_parser.add_argument('--max-locations', type=int, default=50)
+    plan_parser.add_argument('--hourly-dir', type=Path,
+                             help="hourly store --features reads from (default: next to the cache)")
+    run_parser = commands.add_parser('run', help="prefetch a plan file into the caches (resumable)")
+    run_parser.add_argument('plan', type=Path)
+    run_parser.add_argument('--hourly-dir', type=Path, help="also keep full hourly series here (default: next to the cache)")
+    run_parser.add_argument('--background', type=Path, metavar='LOG',
+                            help="detach and prefetch in the background, logging to this file")
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        cache_path = args.input.parent / 'lunker_cache.sqlite'
+        plan = plan_requests(args.input, cache_path, args.features, args.max_locations,
+                             hourly_dir=args.hourly_dir or cache_path.parent / 'hourly')
+        save_plan(plan, args.out)
+        report(plan)
+        print(f"Plan written to {args.out}")
+    elif args.background:
+        command = [sys.executable, __file__, 'run', str(args.plan)]
+        if args.hourly_dir:
+            command += ['--hourly-dir', str(args.hourly_dir)]
+        with open(args.background, 'a') as log:
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        print(f"Prefetching in the background (pid {process.pid}), logging to {args.background}")
+    else:
+        hourly_dir = args.hourly_dir or Path(load_plan(args.plan)['cache']).parent / 'hourly'
+        run(args.plan, hourly_dir)
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Sustained calls/second and burst size per provider
+# Nominatim usage policy: absolute maximum of 1 request per second
+# Open-Meteo free tier: 600 calls/minute, 5000 calls/hour, counted in weighted calls (see open_meteo.request_weight)
+# Mesonet asks for polite, mostly serial access
+PROVIDER_LIMITS = {
+    'nominatim': (1.0, 1),
+    'open-meteo': (5000 / 3600, 10),
+    'mesonet': (0.5, 1),
+}
+# Longer-window quotas enforced on top of PROVIDER_LIMITS, as (calls, seconds) each
+# Open-Meteo free tier: 10,000 calls/day, which a long run or overnight prefetch reaches after ~2 hours
+PROVIDER_QUOTAS = {
+    'open-meteo': [(10_000, 86_400)],
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# geopy signals throttling and outages with its own exception types
+RETRY_EXCEPTION_NAMES = {'GeocoderRateLimited', 'GeocoderUnavailable', 'GeocoderTimedOut',
+                         'ConnectionError', 'Timeout', 'ChunkedEncodingError'}
+# openmeteo_requests raises a bare OpenMeteoRequestsError carrying only the API's reason text
+RETRY_MESSAGES = ('limit exceeded', 'too many requests')
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost: float = 1) -> None:
+        """
+        Take `cost` tokens, waiting until they're available.
+
+        A cost above capacity waits for a full bucket and leaves it in debt,
+        so later callers wait until the sustained rate has been paid back.
+        """
+        needed = min(cost, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= cost
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def provider_limits(provider: str) -> list[tuple[float, float]]:
+    # (rate, capacity) of every bucket a provider's calls go through; a quota is a bucket that refills over its window
+    quotas = PROVIDER_QUOTAS.get(provider, [])
+    return [PROVIDER_LIMITS[provider]] + [(calls / seconds, calls) for calls, seconds in quotas]
+
+
+def get_buckets(provider: str) -> list[TokenBucket]:
+    # One set of buckets per provider per process, so every caller shares the same quota
+    with _buckets_lock:
+        if provider not in _buckets:
+            _buckets[provider] = [TokenBucket(rate, capacity) for rate, capacity in provider_limits(provider)]
+        return _buckets[provider]
+
+
+def share_limits(workers: int) -> None:
+    # Give each of `workers` processes an equal slice of every provider's quota
+    with _buckets_lock:
+        for provider, (rate, capacity) in PROVIDER_LIMITS.items():
+            PROVIDER_LIMITS[provider] = (rate / workers, max(1, capacity // workers))
+        for provider, quotas in PROVIDER_QUOTAS.items():
+            PROVIDER_QUOTAS[provider] = [(calls / workers, seconds) for calls, seconds in quotas]
+        _buckets.clear()
+
+
+def status_code(exc: Exception):
+    response = getattr(exc, 'response', None)
+    code = getattr(response, 'status_code', None)
+    return code if code is not None else getattr(exc, 'status_code', None)
+
+
+def is_retryable(exc: Exception) -> bool:
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRY_STATUS_CODES
+    if any(message in str(exc).lower() for message in RETRY_MESSAGES):
+        return True
+    return any(cls.__name__ in RETRY_EXCEPTION_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after(exc: Exception):
+    # Honour a numeric Retry-After header when the server sends one
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return getattr(exc, 'retry_after', None)
+
+
+class FetchScheduler:
+    """
+    Run provider calls on a thread pool, rate limited by the provider's shared token bucket.
+
+    Args:
+        provider: Key into PROVIDER_LIMITS (and PROVIDER_QUOTAS).
+        max_in_flight: Number of calls allowed to run concurrently.
+        retries: Retries per call on 429/5xx and connection errors.
+        backoff_factor: Base for exponential backoff between retries, in seconds.
+    """
+
+    def __init__(self, provider: str, max_in_flight: int = 4, retries: int = 5, backoff_factor: float = 0.5):
+        self.provider = provider
+        self.buckets = get_buckets(provider)
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+    def call(self, fn, *args, cost: float = 1, **kwargs):
+        # cost is what the provider bills for one attempt, in the units of PROVIDER_LIMITS
+        attempt = 0
+        while True:
+            for bucket in self.buckets:
+                bucket.acquire(cost)
+            start = time.perf_counter()
+            try:
+                # One JSON span per attempt in the --metrics-log, with status error on failures
+                with metrics.span('http', provider=self.provider, attempt=attempt):
+                    result = fn(*args, **kwargs)
+                metrics.observe('http_seconds', time.perf_counter() - start, provider=self.provider)
+                metrics.increment('http_requests', provider=self.provider, outcome='ok')
+                return result
+            except Exception as e:
+                metrics.observe('http_seconds', time.perf_counter() - start, provider=self.provider)
+                if attempt >= self.retries or not is_retryable(e):
+                    metrics.increment('http_requests', provider=self.provider, outcome='error')
+                    raise
+                metrics.increment('http_requests', provider=self.provider, outcome='retry')
+                delay = retry_after(e)
+                if delay is None:
+                    delay = self.backoff_factor * 2 ** attempt * (1 + random.random())
+                attempt += 1
+                time.sleep(delay)
+
+    def map(self, fn, items, cost=None):
+        """
+        Call fn(item) for every item, keeping up to max_in_flight calls running.
+
+        Args:
+            cost: Optional function of an item giving the tokens its call takes; 1 per call otherwise.
+
+        Yields (item, result, error) tuples in the same order as items; error is
+        None on success and the raised exception otherwise.
+        """
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for item in items:
+                item_cost = cost(item) if cost is not None else 1
+                pending.append((item, pool.submit(self.call, fn, item, cost=item_cost)))
+                if len(pending) >= self.max_in_flight * 2:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+
+    @staticmethod
+    def _result(item, future):
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
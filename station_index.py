@@ -0,0 +1,123 @@
+import pickle
+from functools import lru_cache
+
+import numpy as np
+
+# Vectorized distances and the station index live apart from distance.py so importing that stays NumPy-free
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """
+    Vectorized Haversine distance between every point in one set and every point in another.
+
+    Args:
+        lat1, lon1: Arrays of shape (n,) in degrees.
+        lat2, lon2: Arrays of shape (m,) in degrees.
+
+    Returns:
+        Array of shape (n, m) of distances in kilometers.
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _unit_vectors(lats, lons):
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+@lru_cache(maxsize=None)
+def _kdtree_class():
+    # scipy is slow to import, so only load it once an index is actually built
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:  # fall back to a brute-force scan over the stations
+        return None
+    return cKDTree
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def _km_to_chord(km):
+    return 2 * np.sin(np.asarray(km) / (2 * EARTH_RADIUS_KM))
+
+
+class StationIndex:
+    """
+    Nearest-station index over points on the unit sphere.
+
+    Straight-line (chord) distance between unit vectors is monotonic in great
+    circle distance, so a KD-tree over 3D vectors answers nearest/radius
+    queries exactly. Without scipy the same queries fall back to a NumPy scan.
+
+    Args:
+        station_map: Dict of station -> (lat, lon), as written by asos_process.py.
+    """
+
+    def __init__(self, station_map: dict):
+        if not station_map:
+            raise ValueError("Station map cannot be empty.")
+        self.stations = np.array(list(station_map))
+        coords = np.array(list(station_map.values()), dtype=np.float64)
+        self.lats, self.lons = coords[:, 0], coords[:, 1]
+        self.vectors = _unit_vectors(self.lats, self.lons)
+        tree_class = _kdtree_class()
+        self.tree = tree_class(self.vectors) if tree_class is not None else None
+
+    @classmethod
+    def from_pickle(cls, path='station_lat_lon.pkl'):
+        with open(path, 'rb') as fp:
+            return cls(pickle.load(fp))
+
+    def nearest(self, lats, lons, k: int = 1):
+        """
+        Find the k nearest stations for each query point.
+
+        Args:
+            lats, lons: Arrays of query coordinates (in degrees).
+            k: Number of stations per point.
+
+        Returns:
+            Tuple (stations, distances) of arrays shaped (n, k): station ids and distances in kilometers,
+            nearest first.
+        """
+        k = min(k, len(self.stations))
+        points = _unit_vectors(np.atleast_1d(lats), np.atleast_1d(lons))
+        if self.tree is not None:
+            chord, idx = self.tree.query(points, k=k)
+            chord, idx = chord.reshape(len(points), k), idx.reshape(len(points), k)
+        else:
+            chord_all = np.linalg.norm(points[:, None, :] - self.vectors[None, :, :], axis=2)
+            idx = np.argsort(chord_all, axis=1)[:, :k]
+            chord = np.take_along_axis(chord_all, idx, axis=1)
+        return self.stations[idx], _chord_to_km(chord)
+
+    def within(self, lats, lons, radius_km: float):
+        """
+        Find every station within radius_km of each query point.
+
+        Returns:
+            List with one (stations, distances) tuple per query point, nearest first.
+        """
+        points = _unit_vectors(np.atleast_1d(lats), np.atleast_1d(lons))
+        radius = _km_to_chord(radius_km)
+        if self.tree is not None:
+            matches = self.tree.query_ball_point(points, r=radius)
+        else:
+            chord_all = np.linalg.norm(points[:, None, :] - self.vectors[None, :, :], axis=2)
+            matches = [np.flatnonzero(row <= radius) for row in chord_all]
+        results = []
+        for point, idx in zip(points, matches):
+            idx = np.asarray(idx, dtype=np.intp)
+            km = _chord_to_km(np.linalg.norm(self.vectors[idx] - point, axis=1))
+            order = np.argsort(km)
+            results.append((self.stations[idx[order]], km[order]))
+        return results